@@ -8,6 +8,7 @@ import https from 'https';
 import { spawn, type ChildProcessWithoutNullStreams } from 'child_process';
 import archiver from 'archiver';
 import { v4 as uuidv4 } from 'uuid';
+import { createHash } from 'crypto';
 import cors from 'cors';
 
 const app = express();
@@ -101,6 +102,45 @@ type JobSettings = {
   formats?: Record<string, string>;
   musicFile?: string;
   textOverlay?: TextOverlay;
+  container?: 'faststart' | 'fragmented';
+  fragmentSeconds?: number;
+  // false: one profile for every platform; object: per-platform overrides, e.g. { tiktok: { maxSizeMb: 50 } }
+  encodingProfiles?: boolean | Record<string, Record<string, number | string | null>>;
+  // interactive/preview jobs are started before batch/final ones and pause a running one
+  // at its next segment boundary (see generator/scheduler.py)
+  priority?: 'interactive' | 'preview' | 'batch' | 'final';
+  // Frame compositing threads per format (default 1; see generator/memory.py get_frame_workers)
+  frameWorkers?: number;
+  // false: render every format even if an earlier run of the job finished it
+  reuse?: boolean;
+  // RSS budget shared by the job's format processes (default: 75% of memory; see generator/memory.py)
+  memoryBudgetMb?: number;
+};
+
+// Outcome of one format; 'reused' formats were finished by an earlier run of the job
+type FormatStatus = {
+  format: string;
+  platform: string;
+  status: 'done' | 'reused' | 'error';
+  elapsed: number;
+  error?: string;
+};
+
+// One rendered format as reported by the generator (see generate_format's result)
+type FormatOutput = {
+  format: string;
+  platform?: string;
+  file: string;
+  renditions?: { name: string; file: string; width: number; height: number }[];
+  poster?: { file: string; time: number };
+  sprite?: { file: string; tileWidth: number; tileHeight: number; columns: number; times: number[] };
+};
+
+type FragmentProgress = {
+  format: string;
+  fragments: number;
+  bytes: number; // Playable prefix of the growing file
+  seconds: number;
 };
 
 interface Job {
@@ -110,23 +150,165 @@ interface Job {
   settings: JobSettings;
   propertyId: string;
   createdAt: number;
+  queuedAt?: number; // Last time the job entered the queue (createdAt, or a retry)
+  startedAt?: number;
   outputDir: string;
-  files?: string[];
+  files?: string[]; // Videos
+  outputs?: FormatOutput[]; // Per format: videos plus poster and sprite images
   zipFile?: string;
   error?: string;
   process?: ChildProcessWithoutNullStreams; 
   progress?: Record<string, number>; // Store progress per format
+  fragments?: Record<string, FragmentProgress>; // Fragmented MP4 output, per file
+  formats?: FormatStatus[];
+  force?: boolean; // Next run renders every format (retry with force)
+  memory?: { budgetMb: number; peakMb: number }; // The generator's admission plan (::MEMORY::)
 }
 
 const jobs: Record<string, Job> = {};
 const queue: string[] = [];
+
+// Lower is more urgent; same levels as generator/scheduler.py
+const PRIORITY_LEVELS: Record<string, number> = { interactive: 0, preview: 0, batch: 1, final: 1 };
+
+function priorityLevel(job?: Job): number {
+    return PRIORITY_LEVELS[job?.settings.priority ?? 'batch'] ?? 1;
+}
+
+// Queue index of the most urgent queued job, oldest first within a priority
+function mostUrgentIndex(): number {
+    let best = -1;
+    queue.forEach((id, index) => {
+        if (best === -1 || priorityLevel(jobs[id]) < priorityLevel(jobs[queue[best]])) best = index;
+    });
+    return best;
+}
+
+// Most urgent queued job, taken off the queue
+function nextQueuedJob(): string | undefined {
+    const best = mostUrgentIndex();
+    return best === -1 ? undefined : queue.splice(best, 1)[0];
+}
+
+// Milliseconds a job waited in the queue (so far, if it is still queued)
+function queueWait(job: Job): number {
+    const queuedAt = job.queuedAt ?? job.createdAt;
+    if (job.status === 'queued') return Date.now() - queuedAt;
+    return job.startedAt ? job.startedAt - queuedAt : 0;
+}
+
+// Poster and sprite images of the job's formats; not in job.files, which lists videos
+function thumbnailFiles(job: Job): string[] {
+    return (job.outputs ?? []).flatMap(o => [o.poster?.file, o.sprite?.file]).filter((f): f is string => !!f);
+}
+
 let isProcessing = false;
+let runningJobId: string | undefined;
+// A more urgent job started while runningJobId is paused (see preemptRunningJob)
+let preemptingJobId: string | undefined;
+
+// While this file exists the job's generator pauses at its next segment boundary
+// (generator.py --yield-file, scheduler.YieldFile)
+function yieldFile(job: Job): string {
+    return path.join(job.outputDir, '.yield');
+}
+
+// Generator command: bundled generator.exe when present, else the python script
+function resolveGenerator(): { cmd: string; baseArgs: string[] } {
+    const isWin = process.platform === 'win32';
+    
+    // Check if bundled exe exists (for packaged app)
+    // In dev: api/bin/generator.exe
+    // In prod (packaged): resources/bin/generator.exe or similar
+    const bundledExe = path.join(process.cwd(), 'api', 'bin', 'generator.exe');
+    // process.resourcesPath might be undefined in child process, pass via env
+    const resourcesPath = (process as NodeJS.Process & { resourcesPath?: string }).resourcesPath;
+    const resPath = resourcesPath ?? process.env.RESOURCES_PATH ?? '';
+    const bundledExeProd = path.join(resPath, 'bin', 'generator.exe');
+    
+    // Debug log for paths
+    console.log("CWD:", process.cwd());
+    console.log("Bundled Exe Dev:", bundledExe);
+    console.log("Bundled Exe Prod:", bundledExeProd);
+    console.log("Resources Path:", resourcesPath);
+
+    if (fs.existsSync(bundledExe)) {
+        console.log("Using local bundled generator.exe");
+        return { cmd: bundledExe, baseArgs: [] };
+    }
+    if (fs.existsSync(bundledExeProd)) {
+        console.log("Using prod bundled generator.exe");
+        return { cmd: bundledExeProd, baseArgs: [] };
+    }
+
+    // Fallback to python script
+    console.log("Using python script");
+    // If we are here in prod, it means generator.exe is missing!
+    console.error("CRITICAL: Generator executable not found!");
+    
+    // Use full Python path on Windows
+    const pythonPath = isWin 
+        ? 'C:\\Users\\User\\AppData\\Local\\Programs\\Python\\Python311\\python.exe'
+        : 'python3';
+    // Script path for dev mode
+    const scriptPath = path.join(process.cwd(), 'api', 'generator', 'generator.py');
+    return { cmd: pythonPath, baseArgs: [scriptPath] };
+}
+
+// A queued job more urgent than the running one does not wait for it: the running
+// job pauses at its next segment boundary and the urgent one runs next to it.
+// Returns true if an urgent job was started.
+function preemptRunningJob(): boolean {
+    const running = runningJobId ? jobs[runningJobId] : undefined;
+    if (!running || preemptingJobId) return false;
+    const best = mostUrgentIndex();
+    if (best === -1 || priorityLevel(jobs[queue[best]]) >= priorityLevel(running)) return false;
+
+    const jobId = queue.splice(best, 1)[0];
+    const job = jobs[jobId];
+    if (!job || job.status === 'canceled') return preemptRunningJob();
+    try {
+        fs.writeFileSync(yieldFile(running), jobId);
+    } catch (e) {
+        console.error(`[Job ${running.id}] Could not pause for ${jobId}: ${e}`);
+    }
+    const budgetMb = preemptBudgetMb(running);
+    console.log(`Pausing job ${running.id} for ${jobId} (memory budget ${budgetMb}MB)`);
+    preemptingJobId = jobId;
+    runJob(job, true, budgetMb);
+    return true;
+}
+
+// The paused job keeps its workers' memory, so the urgent job only gets what is left of
+// the paused job's budget. Without a plan from it yet, a 1 MB budget limits the urgent job
+// to one format process (see generator plan_format_pool).
+function preemptBudgetMb(paused: Job): number {
+    const plan = paused.memory;
+    return plan ? Math.max(1, plan.budgetMb - plan.peakMb) : 1;
+}
+
+// Resume the paused job once no more urgent job is left to run next to it
+function resumeRunningJob() {
+    if (preemptingJobId) return;
+    const running = runningJobId ? jobs[runningJobId] : undefined;
+    if (running) fs.rm(yieldFile(running), { force: true }, () => undefined);
+}
 
 // Queue Processor
 async function processQueue() {
-    if (isProcessing || queue.length === 0) return;
+    if (isProcessing) {
+        if (!preemptRunningJob()) resumeRunningJob();
+        return;
+    }
+    // The paused job ended first: let the urgent one finish before starting another
+    if (preemptingJobId) return;
+    if (queue.length === 0) {
+        // Idle: run the prewarm that waited for the queue to drain
+        startPrewarm();
+        return;
+    }
     
-    const jobId = queue.shift();
+    const jobId = nextQueuedJob();
     if (!jobId) return;
     
     const job = jobs[jobId];
@@ -136,85 +318,63 @@ async function processQueue() {
     }
 
     isProcessing = true;
+    runningJobId = jobId;
+    // Prewarming only saves time later; it must not slow down a render
+    stopPrewarm();
+    runJob(job, false);
+}
+
+// Spawn the generator for a job. The preempting job runs next to the paused one, within
+// budgetMb, and frees its own slot when it ends.
+function runJob(job: Job, preempting: boolean, budgetMb?: number) {
+    const jobId = job.id;
+    // 'error' and 'close' can both fire for one process
+    let released = false;
+    const release = () => {
+        if (released) return;
+        released = true;
+        if (preempting) {
+            preemptingJobId = undefined;
+        } else {
+            isProcessing = false;
+            runningJobId = undefined;
+            fs.rm(yieldFile(job), { force: true }, () => undefined);
+        }
+    };
     job.status = 'running';
+    job.startedAt = Date.now();
     job.progress = {
         '9x16': 0,
         '1x1': 0,
         '4x5': 0,
         '16x9': 0
     };
+    job.fragments = {};
+    job.memory = undefined;
     
     // Create output dir
     if (!fs.existsSync(job.outputDir)) fs.mkdirSync(job.outputDir, { recursive: true });
+    // A pause left over from an earlier run of the job would hold this one forever
+    fs.rmSync(yieldFile(job), { force: true });
 
     console.log(`Starting job ${jobId}`);
 
-    // Determine python command (python or python3) or exe
-    const isWin = process.platform === 'win32';
-    
-    // Check if bundled exe exists (for packaged app)
-    // In dev: api/bin/generator.exe
-    // In prod (packaged): resources/bin/generator.exe or similar
-    const bundledExe = path.join(process.cwd(), 'api', 'bin', 'generator.exe');
-    // process.resourcesPath might be undefined in child process, pass via env
-    const resourcesPath = (process as NodeJS.Process & { resourcesPath?: string }).resourcesPath;
-    const resPath = resourcesPath ?? process.env.RESOURCES_PATH ?? '';
-    const bundledExeProd = path.join(resPath, 'bin', 'generator.exe');
-    
-    // Debug log for paths
-    console.log("CWD:", process.cwd());
-    console.log("Bundled Exe Dev:", bundledExe);
-    console.log("Bundled Exe Prod:", bundledExeProd);
-    console.log("Resources Path:", resourcesPath);
-
-    let cmd = '';
-    let args: string[] = [];
-    
-    // Script path for dev mode
-    const scriptPath = path.join(process.cwd(), 'api', 'generator', 'generator.py');
-
-    if (fs.existsSync(bundledExe)) {
-        console.log("Using local bundled generator.exe");
-        cmd = bundledExe;
-        args = [
-            '--images', ...job.images,
-            '--id', job.propertyId,
-            '--output', job.outputDir,
-            '--settings', JSON.stringify(job.settings)
-        ];
-    } else if (fs.existsSync(bundledExeProd)) {
-         console.log("Using prod bundled generator.exe");
-         cmd = bundledExeProd;
-         args = [
-            '--images', ...job.images,
-            '--id', job.propertyId,
-            '--output', job.outputDir,
-            '--settings', JSON.stringify(job.settings)
-        ];
-    } else {
-        // Fallback to python script
-        console.log("Using python script");
-        
-        // Use full Python path on Windows
-        const pythonPath = isWin 
-            ? 'C:\\Users\\User\\AppData\\Local\\Programs\\Python\\Python311\\python.exe'
-            : 'python3';
-        
-        // If we are here in prod, it means generator.exe is missing!
-        console.error("CRITICAL: Generator executable not found!");
-        console.log("Job images:", job.images);
-        console.log("Job images count:", job.images.length);
-        
-        // Fix: pass images as comma-separated or ensure proper array spreading
-        args = [
-            scriptPath,
-            '--images', ...job.images,
-            '--id', job.propertyId,
-            '--output', job.outputDir,
-            '--settings', JSON.stringify(job.settings)
-        ];
-        cmd = pythonPath;
-    }
+    const generator = resolveGenerator();
+    const cmd = generator.cmd;
+    const args = [
+        ...generator.baseArgs,
+        '--images', ...job.images,
+        '--id', job.propertyId,
+        '--output', job.outputDir,
+        '--settings', JSON.stringify(budgetMb === undefined ? job.settings : {
+            ...job.settings,
+            memoryBudgetMb: Math.min(budgetMb, job.settings.memoryBudgetMb ?? budgetMb)
+        }),
+        ...(job.force ? ['--force'] : []),
+        '--yield-file', yieldFile(job)
+    ];
+    job.force = undefined;
+    console.log("Job images count:", job.images.length);
 
     console.log(`Executing: ${cmd} ${args.length > 5 ? args.slice(0, 5).join(' ') + ' ...' : args.join(' ')}`);
 
@@ -228,7 +388,7 @@ async function processQueue() {
         console.error(`[Job ${jobId}] Failed to spawn python process: ${err}`);
         job.status = 'error';
         job.error = `Failed to spawn python process: ${err.message}`;
-        isProcessing = false;
+        release();
         processQueue();
     });
 
@@ -245,8 +405,21 @@ async function processQueue() {
         // Could be multiple lines
         const lines = str.split('\n');
         for (const line of lines) {
+            // Fragmented output: ::FRAGMENT::format::file::index::bytes::seconds
+            const fragmentMatch = line.match(/::FRAGMENT::(.*?)::(.*?)::(\d+)::(\d+)::([\d.]+)/);
             const progressMatch = line.match(/::PROGRESS::(.*?)::(\d+)/);
-            if (progressMatch && job.progress) {
+            // Admission control: ::MEMORY::budgetMb::plannedPeakMb
+            const memoryMatch = line.match(/::MEMORY::(\d+)::(\d+)/);
+            if (memoryMatch) {
+                job.memory = { budgetMb: parseInt(memoryMatch[1]), peakMb: parseInt(memoryMatch[2]) };
+            } else if (fragmentMatch && job.fragments) {
+                job.fragments[fragmentMatch[2]] = {
+                    format: fragmentMatch[1],
+                    fragments: parseInt(fragmentMatch[3]),
+                    bytes: parseInt(fragmentMatch[4]),
+                    seconds: parseFloat(fragmentMatch[5])
+                };
+            } else if (progressMatch && job.progress) {
                 const fmt = progressMatch[1];
                 const pct = parseInt(progressMatch[2]);
                 if (job.progress[fmt] !== undefined) {
@@ -261,7 +434,7 @@ async function processQueue() {
 
     child.on('close', async (code) => {
         job.process = undefined;
-        isProcessing = false;
+        release();
 
         if (code === 0) {
             try {
@@ -281,6 +454,8 @@ async function processQueue() {
                     }
                 }
                 
+                job.formats = result?.formats;
+                job.outputs = result?.outputs;
                 if (result && result.status === 'success') {
                     job.files = result.files;
                     
@@ -294,6 +469,8 @@ async function processQueue() {
                 } else {
                     job.status = 'error';
                     job.error = result?.message || 'Unknown python error (no JSON result)';
+                    // Formats that finished stay downloadable; a retry only renders the failed ones
+                    job.files = result?.files;
                 }
             } catch (e) {
                 job.status = 'error';
@@ -546,6 +723,96 @@ app.post('/api/generate', (req, res, next) => {
     }
 });
 
+// 1b. Prewarm: preprocess photos into the generator cache while settings are being picked.
+// The cache is keyed by file content, so the uploads of the later /api/generate call hit it.
+// One prewarm runs at a time and only while no job renders; a request that arrives while
+// busy waits in a single slot (the newest replaces an older one). Image sets that were
+// just prewarmed, or are already running or waiting, are skipped.
+type PrewarmRequest = { id: string; key: string; files: string[] };
+
+const PREWARM_DEDUPE_MS = 10 * 60 * 1000;
+let prewarmChild: ChildProcessWithoutNullStreams | undefined;
+let prewarmRunningKey: string | undefined;
+let pendingPrewarm: PrewarmRequest | undefined;
+const prewarmedAt = new Map<string, number>(); // Image set key -> when its prewarm finished
+
+// Same photos give the same key, whatever their upload paths
+function prewarmKey(files: Express.Multer.File[]): string {
+    const names = files.map((file) => `${file.originalname}:${file.size}`).sort();
+    return createHash('sha256').update(names.join('\n')).digest('hex');
+}
+
+function dropPrewarmUploads(prewarmId: string) {
+    fs.rm(path.join(UPLOADS_DIR, prewarmId), { recursive: true, force: true }, () => undefined);
+}
+
+function startPrewarm() {
+    if (prewarmChild || isProcessing || preemptingJobId || queue.length > 0 || !pendingPrewarm) return;
+    const request = pendingPrewarm;
+    pendingPrewarm = undefined;
+
+    const generator = resolveGenerator();
+    const child = spawn(generator.cmd, [...generator.baseArgs, '--prewarm', '--images', ...request.files]);
+    prewarmChild = child;
+    prewarmRunningKey = request.key;
+    let stdout = '';
+    child.stdout.on('data', (data) => { stdout += data.toString(); });
+    child.stderr.on('data', () => { /* progress output is not needed here */ });
+    let finished = false;
+    const finish = (done: boolean) => {
+        if (finished) return;
+        finished = true;
+        prewarmChild = undefined;
+        prewarmRunningKey = undefined;
+        if (done) {
+            const now = Date.now();
+            prewarmedAt.forEach((at, key) => { if (now - at > PREWARM_DEDUPE_MS) prewarmedAt.delete(key); });
+            prewarmedAt.set(request.key, now);
+        }
+        dropPrewarmUploads(request.id);
+        startPrewarm();
+    };
+    child.on('error', (err) => {
+        console.error(`[Prewarm ${request.id}] Failed to spawn generator: ${err}`);
+        finish(false);
+    });
+    child.on('close', (code) => {
+        console.log(`[Prewarm ${request.id}] ${code === 0 ? stdout.trim() : `stopped (code ${code})`}`);
+        finish(code === 0);
+    });
+}
+
+// A job is starting: stop the running prewarm. The photos it already cached stay cached.
+function stopPrewarm() {
+    if (prewarmChild) {
+        console.log(`[Prewarm] Stopping for a job`);
+        prewarmChild.kill();
+    }
+}
+
+app.post('/api/prewarm', (req, res, next) => {
+    (req as RequestWithJobId).jobId = `prewarm-${uuidv4()}`;
+    next();
+}, upload.fields([{ name: 'images', maxCount: 100 }]), (req, res) => {
+    const prewarmId = (req as RequestWithJobId).jobId ?? '';
+    const uploaded = (req.files as Record<string, Express.Multer.File[]> | undefined)?.images ?? [];
+    if (uploaded.length === 0) return res.status(400).json({ error: 'No images' });
+
+    const key = prewarmKey(uploaded);
+    const finishedAt = prewarmedAt.get(key);
+    if (key === prewarmRunningKey || key === pendingPrewarm?.key
+        || (finishedAt !== undefined && Date.now() - finishedAt < PREWARM_DEDUPE_MS)) {
+        dropPrewarmUploads(prewarmId);
+        return res.json({ prewarmId, images: uploaded.length, status: 'duplicate' });
+    }
+
+    if (pendingPrewarm) dropPrewarmUploads(pendingPrewarm.id);
+    pendingPrewarm = { id: prewarmId, key, files: uploaded.map((file) => file.path) };
+    startPrewarm();
+
+    res.status(202).json({ prewarmId, images: uploaded.length, status: prewarmRunningKey === key ? 'running' : 'deferred' });
+});
+
 // 2. Get Job Status
 app.get('/api/jobs/:id', (req, res) => {
     const job = jobs[req.params.id];
@@ -557,10 +824,32 @@ app.get('/api/jobs/:id', (req, res) => {
         files: job.files,
         zipFile: job.zipFile ? path.basename(job.zipFile) : undefined,
         error: job.error,
-        progress: job.progress
+        progress: job.progress,
+        fragments: job.fragments,
+        priority: job.settings.priority ?? 'batch',
+        queueWaitMs: queueWait(job),
+        formats: job.formats,
+        outputs: job.outputs
     });
 });
 
+// 2b. Progressive preview: the playable prefix of a fragmented MP4 that is still being written
+app.get('/api/jobs/:id/preview/:filename', (req, res) => {
+    const job = jobs[req.params.id];
+    if (!job) return res.status(404).send('Job not found');
+
+    const fragment = job.fragments?.[req.params.filename];
+    if (!fragment) return res.status(404).send('No fragments yet');
+
+    const filePath = path.join(job.outputDir, req.params.filename);
+    if (!fs.existsSync(filePath)) return res.status(404).send('File not found');
+
+    res.setHeader('Content-Type', 'video/mp4');
+    res.setHeader('Content-Length', String(fragment.bytes));
+    res.setHeader('Cache-Control', 'no-store');
+    fs.createReadStream(filePath, { start: 0, end: fragment.bytes - 1 }).pipe(res);
+});
+
 // 3. Download Artifacts
 app.get('/api/jobs/:id/download/:filename', (req, res) => {
     const job = jobs[req.params.id];
@@ -568,7 +857,8 @@ app.get('/api/jobs/:id/download/:filename', (req, res) => {
     
     const filename = req.params.filename;
     // Security check
-    const isValid = (job.files && job.files.includes(filename)) || 
+    const isValid = (job.files && job.files.includes(filename)) ||
+                    thumbnailFiles(job).includes(filename) ||
                     (job.zipFile && filename === path.basename(job.zipFile));
     
     if (!isValid) return res.status(403).send('Access denied');
@@ -607,10 +897,9 @@ app.post('/api/jobs/:id/cancel', (req, res) => {
     if (!job) return res.status(404).json({ error: 'Job not found' });
     
     if (job.status === 'running' && job.process) {
+        // The close handler frees the job's slot and starts the next one
         job.process.kill();
         job.status = 'canceled';
-        isProcessing = false;
-        setTimeout(processQueue, 100); 
     } else if (job.status === 'queued') {
         job.status = 'canceled';
         const idx = queue.indexOf(job.id);
@@ -620,6 +909,27 @@ app.post('/api/jobs/:id/cancel', (req, res) => {
     res.json({ status: 'canceled' });
 });
 
+// 5b. Retry a failed or canceled job. The generator reuses the formats recorded as
+// finished in the job's manifest (see generator/job_manifest.py) and renders the rest;
+// { "force": true } renders every format again.
+app.post('/api/jobs/:id/retry', (req, res) => {
+    const job = jobs[req.params.id];
+    if (!job) return res.status(404).json({ error: 'Job not found' });
+    if (job.status !== 'error' && job.status !== 'canceled') {
+        return res.status(409).json({ error: `Job is ${job.status}` });
+    }
+
+    job.status = 'queued';
+    job.error = undefined;
+    job.queuedAt = Date.now();
+    job.startedAt = undefined;
+    job.force = req.body?.force === true;
+    queue.push(job.id);
+    processQueue();
+
+    res.json({ status: 'queued', failed: job.formats?.filter(f => f.status === 'error').map(f => f.format) ?? [] });
+});
+
 // 6. List Jobs (Outputs Page)
 app.get('/api/jobs', (req, res) => {
     // Return list of jobs sorted by date desc
@@ -630,6 +940,7 @@ app.get('/api/jobs', (req, res) => {
             propertyId: j.propertyId,
             status: j.status,
             createdAt: j.createdAt,
+            queueWaitMs: queueWait(j),
             filesCount: j.files ? j.files.length : 0,
             hasZip: !!j.zipFile
         }));
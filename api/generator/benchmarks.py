@@ -0,0 +1,427 @@
+"""
+Micro-benchmarks for the generator's fast render paths.
+
+    python benchmarks.py crossfade [--width 1080 --height 1920 --fps 60]
+    python benchmarks.py pipe [--width 1080 --height 1920 --fps 30]
+    python benchmarks.py producer [--width 1080 --height 1920 --fps 30 --workers 4]
+    python benchmarks.py text [--width 1080]
+    python benchmarks.py profiles [--width 1080 --height 1920 --fps 30 --images a.jpg,b.jpg]
+    python benchmarks.py memory [--width 1080 --height 1920 --fps 30]
+"""
+import sys
+import json
+import time
+import os
+import argparse
+import tempfile
+import subprocess as sp
+import numpy as np
+from PIL import Image
+
+# Same Pillow 10+ shim as generator.py; moviepy's resize still uses ANTIALIAS
+if not hasattr(Image, 'ANTIALIAS'):
+    Image.ANTIALIAS = Image.Resampling.LANCZOS
+
+from moviepy.config import get_setting
+from moviepy.editor import ImageClip, CompositeVideoClip
+from transitions import crossfade_transition, ripple_transition, circle_transition, spin_transition
+from timeline import StreamingTimeline
+from encoder import FrameEncoder, convert_frame, produce_frames
+
+def synthetic_still(width, height, seed):
+    rng = np.random.default_rng(seed)
+    # Smooth gradients plus noise, closer to photos than pure noise
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // max(1, width - 1), y * 255 // max(1, height - 1), (x + y) % 256], axis=-1)
+    noise = rng.integers(0, 32, size=(height, width, 3))
+    return ((base + noise) % 256).astype(np.uint8)
+
+def time_frames(clip, fps):
+    times = np.arange(0, clip.duration, 1.0 / fps)
+    frames = []
+    started = time.perf_counter()
+    for t in times:
+        frames.append(np.array(clip.get_frame(t), dtype=np.uint8))
+    elapsed = time.perf_counter() - started
+    return frames, len(times) / elapsed if elapsed > 0 else float("inf")
+
+def bench_crossfade(width=1080, height=1920, fps=60, duration=0.8):
+    """Integer crossfade kernel vs moviepy's compose path with a crossfadein mask."""
+    a = ImageClip(synthetic_still(width, height, 1)).set_duration(duration)
+    b = ImageClip(synthetic_still(width, height, 2)).set_duration(duration)
+
+    reference = CompositeVideoClip([a, b.crossfadein(duration)], size=(width, height)).set_duration(duration)
+    candidate = crossfade_transition(a, b, duration, fps)
+
+    ref_frames, ref_fps = time_frames(reference, fps)
+    new_frames, new_fps = time_frames(candidate, fps)
+    max_diff = max(int(np.abs(r.astype(np.int16) - n).max()) for r, n in zip(ref_frames, new_frames))
+    return {
+        "benchmark": "crossfade",
+        "size": f"{width}x{height}",
+        "fps": fps,
+        "frames": len(new_frames),
+        "moviepyFps": round(ref_fps, 1),
+        "integerFps": round(new_fps, 1),
+        "speedup": round(new_fps / ref_fps, 2),
+        "maxPixelDiff": max_diff
+    }
+
+def pipe_throughput(frames, pix_fmt, width, height):
+    """Frames/s through the pipe into ffmpeg, including its conversion to yuv420p."""
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", pix_fmt,
+        "-s", f"{width}x{height}", "-i", "-", "-vcodec", "rawvideo", "-pix_fmt", "yuv420p", "-f", "null", "-"
+    ]
+    proc = sp.Popen(cmd, stdin=sp.PIPE)
+    started = time.perf_counter()
+    for frame in frames:
+        proc.stdin.write(memoryview(convert_frame(frame, pix_fmt)).cast("B"))
+    proc.stdin.close()
+    proc.wait()
+    return len(frames) / (time.perf_counter() - started)
+
+def encode_fps(frames, pix_fmt, width, height, fps):
+    """End-to-end frames/s for libx264 with the generator's encoder settings."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        encoder = FrameEncoder(
+            f"{temp_dir}/bench.mp4", (width, height), fps, preset="medium",
+            ffmpeg_params=["-crf", "18"], pix_fmt=pix_fmt
+        )
+        started = time.perf_counter()
+        for frame in frames:
+            encoder.write_frame(convert_frame(frame, pix_fmt))
+        encoder.close()
+        return len(frames) / (time.perf_counter() - started)
+
+def bench_pipe(width=1080, height=1920, fps=30, count=60):
+    """RGB24 vs numpy YUV420 frames into ffmpeg: pipe throughput and libx264 encode fps."""
+    a = synthetic_still(width, height, 1)
+    b = synthetic_still(width, height, 2)
+    # A crossfade, so every frame differs and has to be converted
+    frames = [((a.astype(np.uint16) * (count - i) + b.astype(np.uint16) * i) // count).astype(np.uint8) for i in range(count)]
+
+    started = time.perf_counter()
+    for frame in frames:
+        convert_frame(frame, "yuv420p")
+    convert_ms = (time.perf_counter() - started) * 1000.0 / count
+
+    result = {"benchmark": "pipe", "size": f"{width}x{height}", "frames": count, "numpyConvertMs": round(convert_ms, 2)}
+    for pix_fmt in ("rgb24", "yuv420p"):
+        result[f"{pix_fmt}PipeFps"] = round(pipe_throughput(frames, pix_fmt, width, height), 1)
+        result[f"{pix_fmt}EncodeFps"] = round(encode_fps(frames, pix_fmt, width, height, fps), 1)
+    return result
+
+PRODUCER_TRANSITIONS = [
+    lambda c1, c2, d: ripple_transition(c1, c2, d),
+    lambda c1, c2, d: circle_transition(c1, c2, d, 'open'),
+    lambda c1, c2, d: spin_transition(c1, c2, d, 'in')
+]
+
+def producer_fps(width, height, fps, workers, count=4, duration=1.0, trans_duration=0.8):
+    """Frames/s out of produce_frames for a ripple/circle/spin timeline, with a digest of every frame."""
+    stills = [synthetic_still(width, height, seed) for seed in range(count)]
+    clip_duration = duration + 2 * trans_duration
+    transitions = iter(PRODUCER_TRANSITIONS * count)
+    timeline = StreamingTimeline(
+        count,
+        lambda index: ImageClip(stills[index]).set_duration(clip_duration),
+        duration,
+        trans_duration,
+        make_transition=lambda c1, c2, d: next(transitions)(c1, c2, d)
+    )
+    clip = timeline.to_clip()
+    times = np.arange(0, clip.duration, 1.0 / fps)
+    digest = []
+    started = time.perf_counter()
+    for _, _, data in produce_frames(clip, times, "rgb24", timeline.static_key, workers, 2 * workers):
+        digest.append(int(np.asarray(data, dtype=np.uint32).sum()))
+    elapsed = time.perf_counter() - started
+    timeline.close()
+    return len(times) / elapsed, digest
+
+def bench_producer(width=1080, height=1920, fps=30, workers=4):
+    """Serial vs threaded frame production on transition-heavy content (no encoding)."""
+    serial_fps, serial_digest = producer_fps(width, height, fps, 1)
+    threaded_fps, threaded_digest = producer_fps(width, height, fps, workers)
+    return {
+        "benchmark": "producer",
+        "size": f"{width}x{height}",
+        "fps": fps,
+        "frames": len(serial_digest),
+        "workers": workers,
+        "serialFps": round(serial_fps, 1),
+        "threadedFps": round(threaded_fps, 1),
+        "speedup": round(threaded_fps / serial_fps, 2),
+        "identical": serial_digest == threaded_digest
+    }
+
+TEXT_LINES = [
+    ("Sunny 2BR apartment near the park", 64, 3, 0),
+    ("$120,000", 56, 3, 4),
+    ("+995 555 12 34 56", 40, 2, 2),
+    ("LUMINAVIDS", 30, 1, 0),
+    ("No outline", 36, 0, 1)
+]
+
+def text_rasters(width, fast, cache=None):
+    from generator import create_pil_text_clip
+    rasters = []
+    for text, size, stroke, spacing in TEXT_LINES:
+        clip = create_pil_text_clip(text, size, 'white', stroke, width, 1920, 'left', 0,
+                                    letter_spacing=spacing, font_family='Inter', font_key='en_inter',
+                                    cache=cache, fast=fast)
+        rgb = clip.get_frame(0)
+        alpha = np.round(clip.mask.get_frame(0) * 255).astype(np.uint8)
+        rasters.append(np.dstack([rgb, alpha]))
+    return rasters
+
+def bench_text(width=1080, repeats=5, **_):
+    """Outline drawn by repeated text() calls vs one rasterisation blended in numpy, plus cached lookups."""
+    import generator
+    from cache import DiskCache
+    timings = {}
+    rasters = {}
+    for fast in (False, True):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            generator._text_raster_memo.clear()
+            rasters[fast] = text_rasters(width, fast)
+        timings[fast] = (time.perf_counter() - started) * 1000.0 / repeats
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = DiskCache(cache_dir)
+        generator._text_raster_memo.clear()
+        text_rasters(width, True, cache)
+        generator._text_raster_memo.clear()
+        started = time.perf_counter()
+        disk = text_rasters(width, True, cache)
+        disk_ms = (time.perf_counter() - started) * 1000.0
+        started = time.perf_counter()
+        text_rasters(width, True, cache)
+        memo_ms = (time.perf_counter() - started) * 1000.0
+
+    lines = []
+    for (text, _, stroke, spacing), old, new, cached in zip(TEXT_LINES, rasters[False], rasters[True], disk):
+        same_shape = old.shape == new.shape
+        diff = np.abs(old.astype(np.int16) - new) if same_shape else None
+        lines.append({
+            "text": text,
+            "stroke": stroke,
+            "spacing": spacing,
+            "sameShape": same_shape,
+            "identicalBytes": bool(same_shape and not diff.any()),
+            "differingPixels": round(float((diff.max(axis=2) > 0).mean()), 4) if same_shape else None,
+            "maxDiff": int(diff.max()) if same_shape else None,
+            "alphaPsnr": round(psnr(old[:, :, 3], new[:, :, 3]), 2) if same_shape else None,
+            "cacheRoundTripIdentical": bool(np.array_equal(cached, new))
+        })
+    return {
+        "benchmark": "text",
+        "width": width,
+        "stampedMs": round(timings[False], 1),
+        "blendedMs": round(timings[True], 1),
+        "diskCacheMs": round(disk_ms, 1),
+        "memoryCacheMs": round(memo_ms, 1),
+        "lines": lines
+    }
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+# Boxes on the path to the sync sample table
+MP4_CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+def mp4_sync_samples(path):
+    """1-based sample numbers of the keyframes, from the first video track's stss box."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    def walk(start, end):
+        offset = start
+        while offset + 8 <= end:
+            size = int.from_bytes(data[offset:offset + 4], "big")
+            box_type = data[offset + 4:offset + 8]
+            header = 8
+            if size == 1:
+                size, header = int.from_bytes(data[offset + 8:offset + 16], "big"), 16
+            elif size == 0:
+                size = end - offset
+            if size < header:
+                return None
+            if box_type == b"stss":
+                count = int.from_bytes(data[offset + 12:offset + 16], "big")
+                return [int.from_bytes(data[offset + 16 + 4 * i:offset + 20 + 4 * i], "big") for i in range(count)]
+            if box_type in MP4_CONTAINER_BOXES:
+                found = walk(offset + header, offset + size)
+                if found is not None:
+                    return found
+            offset += size
+        return None
+
+    return walk(0, len(data)) or []
+
+def bench_profiles(width=1080, height=1920, fps=30, count=5, images=None):
+    """
+    Bytes, PSNR against a lossless render and keyframe placement for every
+    encoding profile. images: photos to use instead of synthetic stills
+    (the synthetic noise is much harder to compress than photos).
+    """
+    from moviepy.editor import VideoFileClip
+    from encoder import ENCODING_PROFILES
+    from generator import generate_format
+    settings = {"fps": fps, "secondsPerImage": 3.0, "transition": "fade", "transitionDuration": 0.8,
+                "thumbnails": False, "preprocessCache": False}
+    renders = [("lossless", None, {"encodingProfiles": False, "crf": 0}), ("default", None, {"encodingProfiles": False})]
+    renders += [(name, name.upper(), {}) for name in ENCODING_PROFILES if name != "default"]
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        if images:
+            count = len(images)
+        images = list(images or [])
+        for index in range(len(images), count):
+            path = os.path.join(work_dir, f"image_{index}.jpg")
+            Image.fromarray(synthetic_still(width, height, index + 1)).save(path, quality=95)
+            images.append(path)
+        paths = {}
+        for label, platform, extra in renders:
+            started = time.perf_counter()
+            out_dir = os.path.join(work_dir, label)
+            os.makedirs(out_dir)
+            result = generate_format("bench", (width, height), images, os.path.join(out_dir, "temp"), label, out_dir,
+                                     dict(settings, **extra), platform)
+            paths[label] = os.path.join(out_dir, result["file"])
+            results.append({"render": label, "profile": result.get("profile"), "seconds": round(time.perf_counter() - started, 1),
+                            "bytes": os.path.getsize(paths[label])})
+
+        # Each slide body starts after the previous body (3 s) and its fade (0.8 s)
+        slide_starts = [3.8 * i for i in range(count)]
+        with VideoFileClip(paths["lossless"]) as ref:
+            times = np.arange(0.25, ref.duration - 1.0 / fps, 0.5)
+            reference = [ref.get_frame(t) for t in times]
+            for entry in results[1:]:
+                with VideoFileClip(paths[entry["render"]]) as clip:
+                    scores = [psnr(a, clip.get_frame(t)) for a, t in zip(reference, times)]
+                keyframes = [(n - 1) / float(fps) for n in mp4_sync_samples(paths[entry["render"]])]
+                entry["kbps"] = round(entry["bytes"] * 8 / 1000.0 / ref.duration)
+                entry["minPsnr"] = round(min(scores), 2)
+                entry["meanPsnr"] = round(float(np.mean(scores)), 2)
+                entry["keyframes"] = len(keyframes)
+                entry["keyframeAtEverySlide"] = all(any(abs(k - s) < 0.5 / fps for k in keyframes) for s in slide_starts)
+    return {"benchmark": "profiles", "size": f"{width}x{height}", "renders": results}
+
+# name -> (source image size, count, settings); every case renders one format at the benchmark size
+MEMORY_CASES = {
+    "cut": ((4000, 3000), 4, {"transition": "cut"}),
+    "ripple_text": ((4000, 3000), 4, {"transition": "ripple", "text": True}),
+    "panorama": ((6000, 2000), 3, {"transition": "wipe_left", "text": True}),
+    "renditions": ((4000, 3000), 3, {"transition": "fade", "renditions": ["720p", "480p"]})
+}
+
+def measure_format(conn, size, images, settings, out_dir):
+    """Forked child: render one format, send back (worker peak, summed encoder peak) in bytes."""
+    import threading
+    import resource
+    from loadtest import tree_rss
+    from generator import generate_format
+    # Only the parent reports
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peak[0] = max(peak[0], tree_rss(os.getpid()))
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        generate_format("9x16", size, images, os.path.join(out_dir, "temp"), "mem", out_dir, settings, "TIKTOK", 1)
+    finally:
+        done.set()
+        sampler.join()
+    # ru_maxrss is in KiB; the children figure is the largest single ffmpeg
+    worker = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    encoder = max(peak[0], resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+    conn.send((worker, encoder))
+    conn.close()
+
+def bench_memory(width=1080, height=1920, fps=30):
+    """
+    Admission control check: estimate_format_memory against the measured peak
+    RSS of a format worker plus its ffmpeg encoders, for large photos, masked
+    transitions with text, panoramas and extra renditions. Each case renders
+    in a forked process, as pool workers do. passed is false if any render
+    went over its estimate.
+    """
+    import multiprocessing
+    from memory import estimate_format_memory, MB
+    from encoder import parse_renditions
+    from equivalence import TEXT_OVERLAY
+    context = multiprocessing.get_context("fork")
+    cases = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, ((img_w, img_h), count, extra) in MEMORY_CASES.items():
+            case_dir = os.path.join(work_dir, name)
+            os.makedirs(case_dir)
+            images = []
+            for index in range(count):
+                path = os.path.join(case_dir, f"image_{index}.jpg")
+                Image.fromarray(synthetic_still(img_w, img_h, index + 1)).save(path, quality=92)
+                images.append(path)
+            settings = {"fps": fps, "secondsPerImage": 2.0, "transitionDuration": 0.8, "preprocessCache": False,
+                        "cacheDir": os.path.join(work_dir, "cache"), "transition": extra["transition"]}
+            if extra.get("text"):
+                settings["textOverlay"] = TEXT_OVERLAY
+            if extra.get("renditions"):
+                settings["renditions"] = extra["renditions"]
+            renditions = [s for _, s in parse_renditions(settings, "9x16", width, height)]
+            estimate, _ = estimate_format_memory([(img_w, img_h)] * count, (width, height), settings, renditions)
+
+            receiver, sender = context.Pipe(duplex=False)
+            proc = context.Process(target=measure_format, args=(sender, (width, height), images, settings, case_dir))
+            proc.start()
+            sender.close()
+            worker, encoder = receiver.recv()
+            proc.join()
+            cases.append({
+                "case": name,
+                "outputs": 1 + len(renditions),
+                "estimateMb": estimate // MB,
+                "workerMb": worker // MB,
+                "encodersMb": encoder // MB,
+                "measuredMb": (worker + encoder) // MB,
+                "withinEstimate": worker + encoder <= estimate
+            })
+    return {"benchmark": "memory", "size": f"{width}x{height}", "threads": os.cpu_count(), "cases": cases,
+            "passed": all(c["withinEstimate"] for c in cases)}
+
+BENCHMARKS = {
+    "crossfade": bench_crossfade,
+    "pipe": bench_pipe,
+    "producer": bench_producer,
+    "text": bench_text,
+    "profiles": bench_profiles,
+    "memory": bench_memory
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--width", type=int, default=1080)
+    parser.add_argument("--height", type=int, default=1920)
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=4, help="Producer threads (producer benchmark)")
+    parser.add_argument("--images", help="Comma-separated photos (profiles benchmark)")
+    args = parser.parse_args()
+    kwargs = {"width": args.width, "height": args.height, "fps": args.fps}
+    if args.name == "producer":
+        kwargs["workers"] = args.workers
+    if args.name == "profiles" and args.images:
+        kwargs["images"] = args.images.split(",")
+    if args.name == "text":
+        kwargs = {"width": args.width}
+    result = BENCHMARKS[args.name](**kwargs)
+    sys.stdout.write(json.dumps(result) + "\n")
+    if result.get("passed") is False:
+        sys.exit(1)
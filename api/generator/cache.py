@@ -0,0 +1,146 @@
+import os
+import stat
+import shutil
+import hashlib
+import tempfile
+import threading
+
+MB = 1024 * 1024
+DEFAULT_CACHE_MAX_MB = 2048
+
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+def get_cache_dir(settings=None, name=""):
+    """Cache root: settings.cacheDir, LVIDS_CACHE_DIR, or <tmp>/lvids_cache."""
+    settings = settings or {}
+    root = settings.get("cacheDir") or os.environ.get("LVIDS_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "lvids_cache")
+    return os.path.join(root, name) if name else root
+
+def get_cache_limit(settings=None):
+    """
+    Cache size cap in bytes: settings.cacheMaxMb, LVIDS_CACHE_MAX_MB, or 2 GB.
+    One cap for the whole cache root, shared by its subdirectories.
+    """
+    settings = settings or {}
+    for value in (settings.get("cacheMaxMb"), os.environ.get("LVIDS_CACHE_MAX_MB")):
+        try:
+            if value is not None:
+                return int(float(value) * MB)
+        except (TypeError, ValueError):
+            continue
+    return DEFAULT_CACHE_MAX_MB * MB
+
+def open_cache(settings, name):
+    """The named cache under the cache root, evicting against the root's shared cap."""
+    return DiskCache(get_cache_dir(settings, name), get_cache_limit(settings), budget_root=get_cache_dir(settings))
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoized per (path, size, mtime) in this process."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        cached = _digest_memo.get(memo_key)
+    if cached:
+        return cached
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+class DiskCache:
+    """
+    Directory of immutable cache entries shared by processes and jobs.
+    Entries are written to a temp name and renamed into place, reads bump the
+    entry's mtime, and evict() removes least recently used entries until the
+    directory fits under max_bytes. A max_bytes of 0 disables eviction.
+    With budget_root, max_bytes covers every cache directory under it and
+    evict() removes the least recently used entries across all of them.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_CACHE_MAX_MB * MB, budget_root=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.budget_root = budget_root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key, ext=""):
+        return os.path.join(self.root, f"{key}{ext}")
+
+    def get(self, key, ext=""):
+        path = self.path_for(key, ext)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def temp_path(self, key, ext=""):
+        """Private path to write an entry to before commit()."""
+        fd, path = tempfile.mkstemp(prefix=f".{key}.", suffix=f".tmp{ext}", dir=self.root)
+        os.close(fd)
+        return path
+
+    def commit(self, temp_path, key, ext=""):
+        path = self.path_for(key, ext)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+        return path
+
+    def export(self, key, ext, dest_path):
+        """Hard-link (or copy) an entry out of the cache so eviction can't remove it mid-use."""
+        src = self.path_for(key, ext)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(src, dest_path)
+        except OSError:
+            shutil.copyfile(src, dest_path)
+        return dest_path
+
+    def _directories(self):
+        if self.budget_root is None:
+            return [self.root]
+        try:
+            names = os.listdir(self.budget_root)
+        except OSError:
+            return [self.root]
+        paths = [os.path.join(self.budget_root, name) for name in names]
+        return [path for path in paths if os.path.isdir(path)]
+
+    def evict(self):
+        if not self.max_bytes:
+            return
+        entries = []
+        total = 0
+        for directory in self._directories():
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -0,0 +1,416 @@
+import os
+import sys
+import subprocess as sp
+import tempfile
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from proglog import default_bar_logger
+from moviepy.config import get_setting
+
+PIPE_FORMATS = ("rgb24", "yuv420p")
+
+# BT.601 limited range in 8-bit fixed point, as swscale uses for rgb24 -> yuv420p
+_Y_COEFFS = (66, 129, 25)
+_UV_COEFFS = np.array([
+    [-38, 112],
+    [-74, -94],
+    [112, -18]
+], dtype=np.float32)
+
+def rgb_to_yuv420p(frame):
+    """
+    Convert an RGB uint8 frame (even width/height) to planar YUV420 bytes.
+    Luma is computed per pixel in uint16; chroma from the 2x2 sum of RGB.
+    """
+    h, w = frame.shape[:2]
+    size = w * h
+    out = np.empty(size * 3 // 2, dtype=np.uint8)
+
+    y = np.empty((h, w), dtype=np.uint16)
+    tmp = np.empty((h, w), dtype=np.uint16)
+    np.multiply(frame[:, :, 0], _Y_COEFFS[0], out=y, dtype=np.uint16)
+    np.multiply(frame[:, :, 1], _Y_COEFFS[1], out=tmp, dtype=np.uint16)
+    np.add(y, tmp, out=y)
+    np.multiply(frame[:, :, 2], _Y_COEFFS[2], out=tmp, dtype=np.uint16)
+    np.add(y, tmp, out=y)
+    np.add(y, 128, out=y)
+    np.right_shift(y, 8, out=y)
+    np.add(y, 16, out=y)
+    out[:size] = y.ravel()
+
+    # Sum row pairs (contiguous), then column pairs: 4x the 2x2 average
+    rows = np.add(frame[0::2, :, :3], frame[1::2, :, :3], dtype=np.uint16)
+    pairs = rows.reshape(h // 2, w // 2, 2, 3)
+    quad = np.add(pairs[:, :, 0], pairs[:, :, 1], dtype=np.float32)
+    uv = quad.reshape(-1, 3) @ _UV_COEFFS
+    # Undo the 4x sum and the 8-bit coefficient scale, with rounding
+    uv *= 1.0 / 1024.0
+    uv += 128.5
+    np.clip(uv, 0, 255, out=uv)
+    out[size:size * 5 // 4] = uv[:, 0]
+    out[size * 5 // 4:] = uv[:, 1]
+    return out
+
+def convert_frame(frame, pix_fmt):
+    """Frame bytes for the ffmpeg pipe in the given raw pixel format."""
+    if pix_fmt == "yuv420p":
+        return rgb_to_yuv420p(frame)
+    return np.ascontiguousarray(frame[:, :, :3])
+
+CONTAINERS = ("faststart", "fragmented")
+
+def container_params(container="faststart", fps=30, fragment_seconds=2.0, keyframes=True):
+    """
+    ffmpeg output options for the MP4 layout. "faststart" moves the moov atom
+    to the front once encoding ends; "fragmented" writes an empty moov and a
+    moof/mdat fragment per keyframe, with keyframes forced every
+    fragment_seconds, so the file is playable while it grows. keyframes=False
+    leaves the keyframe options to the caller (see encoding_params).
+    """
+    if container == "fragmented":
+        params = ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+        if keyframes:
+            gop = max(1, int(round(fragment_seconds * fps)))
+            params += ["-force_key_frames", f"expr:gte(t,n_forced*{fragment_seconds})", "-g", str(gop)]
+        return params
+    return ["-movflags", "+faststart"]
+
+# Encoder settings per platform; keys match DEFAULT_FORMATS/ALLOWED_FORMATS in
+# generator.py. "default" is used for renders without a platform and keeps the
+# original crf 18 output. maxrateKbps caps the bitrate with a one second VBV
+# buffer, maxSizeMb lowers that cap so the whole file fits, and gopSeconds
+# bounds the distance between keyframes. tune is passed to libx264;
+# "stillimage" measured larger and worse (PSNR) on photo slideshows with pans,
+# so no profile sets it by default.
+ENCODING_PROFILES = {
+    "default": {"crf": 18, "preset": "medium", "tune": None, "maxrateKbps": None, "maxSizeMb": None,
+                "gopSeconds": None, "audioKbps": 128},
+    "tiktok": {"crf": 21, "preset": "medium", "tune": None, "maxrateKbps": 6000, "maxSizeMb": 250,
+               "gopSeconds": 5, "audioKbps": 128},
+    "instagram": {"crf": 21, "preset": "medium", "tune": None, "maxrateKbps": 5000, "maxSizeMb": 100,
+                  "gopSeconds": 5, "audioKbps": 128},
+    "facebook": {"crf": 21, "preset": "medium", "tune": None, "maxrateKbps": 6000, "maxSizeMb": 1024,
+                 "gopSeconds": 5, "audioKbps": 128},
+    "youtube": {"crf": 19, "preset": "medium", "tune": None, "maxrateKbps": 12000, "maxSizeMb": None,
+                "gopSeconds": 5, "audioKbps": 192}
+}
+
+def encoding_profile(platform, settings=None):
+    """
+    (name, profile) for a platform id. settings.encodingProfiles may be False
+    (every platform uses "default") or a dict of per-platform overrides, e.g.
+    {"tiktok": {"maxSizeMb": 50}}. settings.crf overrides the profile's crf.
+    """
+    settings = settings or {}
+    overrides = settings.get("encodingProfiles", True)
+    name = (platform or "default").lower()
+    if overrides is False or name not in ENCODING_PROFILES:
+        name = "default"
+    profile = dict(ENCODING_PROFILES[name])
+    if isinstance(overrides, dict):
+        profile.update(overrides.get(name) or {})
+    if settings.get("crf") is not None:
+        profile["crf"] = settings["crf"]
+    return name, profile
+
+def encoding_params(profile, fps, duration, keyframe_times=(), codec="libx264", audio=False):
+    """
+    ffmpeg output options for an encoding profile: crf, the VBV cap, tune,
+    GOP length and keyframes forced at keyframe_times (slide starts), so
+    seeking to any slide lands on a keyframe.
+    """
+    params = ["-crf", str(profile["crf"])]
+    audio_kbps = int(profile.get("audioKbps") or 128) if audio else 0
+
+    maxrate = profile.get("maxrateKbps")
+    if profile.get("maxSizeMb") and duration > 0:
+        # The average can exceed maxrate by at most one buffer (1 s); keep 3% for the container
+        budget_kbit = float(profile["maxSizeMb"]) * 8000 * 0.97
+        size_rate = int(budget_kbit / (duration + 1.0)) - audio_kbps
+        maxrate = min(maxrate, size_rate) if maxrate else size_rate
+    if maxrate:
+        maxrate = max(100, int(maxrate))
+        params += ["-maxrate", f"{maxrate}k", "-bufsize", f"{maxrate}k"]
+
+    if profile.get("tune") and codec == "libx264":
+        params += ["-tune", profile["tune"]]
+    if profile.get("gopSeconds"):
+        params += ["-g", str(max(1, int(round(float(profile["gopSeconds"]) * fps))))]
+    times = sorted({round(float(t), 3) for t in keyframe_times if 0 <= t < duration})
+    if times:
+        params += ["-force_key_frames", ",".join(f"{t:.3f}" for t in times)]
+    if audio:
+        params += ["-b:a", f"{audio_kbps}k"]
+    return params
+
+class FragmentWatcher:
+    """
+    Follows a fragmented MP4 while ffmpeg writes it and reports every
+    complete moof/mdat pair as on_fragment(index, playable_bytes, seconds).
+    Register as an observer of write_outputs and call poll() once more after
+    the encoders closed. seconds is how much video had been piped when the
+    fragment was seen (an upper bound of its end time).
+    """
+
+    def __init__(self, path, fps, on_fragment):
+        self.path = path
+        self.fps = fps
+        self.on_fragment = on_fragment
+        self.offset = 0
+        self.size = 0
+        self.count = 0
+        self.frames = 0
+        self._in_fragment = False
+
+    def __call__(self, frame, t):
+        self.frames += 1
+        self.poll()
+
+    def poll(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size == self.size:
+            return
+        self.size = size
+        with open(self.path, "rb") as f:
+            while self.offset + 8 <= size:
+                f.seek(self.offset)
+                header = f.read(16)
+                box_size = int.from_bytes(header[:4], "big")
+                box_type = header[4:8]
+                if box_size == 1:
+                    if len(header) < 16:
+                        break
+                    box_size = int.from_bytes(header[8:16], "big")
+                # 0 means "to the end of the file": not complete yet
+                if box_size < 8 or self.offset + box_size > size:
+                    break
+                self.offset += box_size
+                if box_type == b"moof":
+                    self._in_fragment = True
+                elif box_type == b"mdat" and self._in_fragment:
+                    self._in_fragment = False
+                    self.count += 1
+                    self.on_fragment(self.count, self.offset, self.frames / float(self.fps))
+
+def even(value):
+    return max(2, int(round(value / 2.0)) * 2)
+
+def rendition_size(entry, width, height):
+    """(name, (w, h)) of one settings.renditions entry; raises ValueError if it is unusable."""
+    if isinstance(entry, str):
+        entry = {"name": entry.strip(), "shortSide": entry.strip().rstrip("pP")}
+    if not isinstance(entry, dict):
+        raise ValueError("expected a string like \"720p\" or an object")
+    name = str(entry.get("name") or "")
+    if entry.get("width") and entry.get("height"):
+        size = (even(float(entry["width"])), even(float(entry["height"])))
+    elif entry.get("shortSide"):
+        scale = float(entry["shortSide"]) / min(width, height)
+        size = (even(width * scale), even(height * scale))
+    else:
+        raise ValueError("needs shortSide or width and height")
+    if min(size) <= 2 or max(size) > 2 * max(width, height):
+        raise ValueError(f"size {size[0]}x{size[1]} is out of range")
+    return name, size
+
+def parse_renditions(settings, fmt_key, width, height):
+    """
+    Extra renditions for a format from settings.renditions: a list applied to
+    every format or a dict keyed by format. Entries are "720p" strings or
+    {"name", "shortSide"} / {"name", "width", "height"} objects.
+    Returns [(name, (w, h))] with even dimensions, skipping full-size duplicates.
+    Invalid entries are skipped with a warning on stderr; they never fail the
+    main output.
+    """
+    raw = settings.get("renditions") or []
+    if isinstance(raw, dict):
+        raw = raw.get(fmt_key) or []
+    if not isinstance(raw, (list, tuple)):
+        raw = [raw]
+    renditions = []
+    for entry in raw:
+        try:
+            name, size = rendition_size(entry, width, height)
+        except (TypeError, ValueError, OverflowError) as e:
+            sys.stderr.write(f"Warning: skipping rendition {entry!r} for {fmt_key}: {e}\n")
+            sys.stderr.flush()
+            continue
+        if not name:
+            name = f"{min(size)}p"
+        if size != (width, height) and all(name != n for n, _ in renditions):
+            renditions.append((name, size))
+    return renditions
+
+class FrameEncoder:
+    """
+    One ffmpeg process encoding raw frames from stdin. Frames are always
+    given at the source size; out_size adds a scale filter so several
+    encoders can share one composited frame stream. pix_fmt is the layout
+    of the piped frames (see convert_frame).
+    """
+
+    def __init__(self, path, size, fps, out_size=None, codec="libx264", preset="medium",
+                 ffmpeg_params=None, threads=None, audiofile=None, audio_codec=None, pix_fmt="rgb24"):
+        self.path = path
+        self.size = size
+        w, h = size
+        cmd = [
+            get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-vcodec", "rawvideo",
+            "-s", f"{w}x{h}", "-pix_fmt", pix_fmt, "-r", f"{fps:.02f}",
+            "-an", "-i", "-"
+        ]
+        if audiofile:
+            cmd += ["-i", audiofile, "-acodec", audio_codec or "aac"]
+        cmd += ["-vcodec", codec, "-preset", preset]
+        cmd += list(ffmpeg_params or [])
+        if threads:
+            cmd += ["-threads", str(threads)]
+        if out_size and tuple(out_size) != tuple(size):
+            cmd += ["-vf", f"scale={out_size[0]}:{out_size[1]}:flags=lanczos"]
+        cmd += ["-pix_fmt", "yuv420p", path]
+
+        self._stderr = tempfile.TemporaryFile()
+        self.proc = sp.Popen(cmd, stdin=sp.PIPE, stdout=sp.DEVNULL, stderr=self._stderr)
+
+    def write_frame(self, data):
+        try:
+            self.proc.stdin.write(memoryview(data).cast("B"))
+        except (BrokenPipeError, OSError):
+            raise IOError(f"ffmpeg failed while writing {os.path.basename(self.path)}: {self._error_text()}")
+
+    def _error_text(self):
+        self.proc.wait()
+        self._stderr.seek(0)
+        return self._stderr.read().decode("utf8", errors="replace").strip()
+
+    def close(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+        code = self.proc.wait()
+        error = self._error_text() if code else ""
+        self._stderr.close()
+        if code:
+            raise IOError(f"ffmpeg exited with code {code} for {os.path.basename(self.path)}: {error}")
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self._stderr.close()
+
+def write_audio_track(clip, temp_dir):
+    """
+    Render the clip's audio once so every rendition can mux the same file.
+    The track is 16-bit PCM, so each output encodes it to AAC exactly once
+    (at its profile's -b:a) instead of transcoding an already lossy track.
+    """
+    if clip.audio is None:
+        return None
+    audio_path = os.path.join(temp_dir, "audio_track.wav")
+    clip.audio.write_audiofile(audio_path, fps=44100, nbytes=2, buffersize=2000, codec="pcm_s16le", logger=None)
+    return audio_path
+
+def render_frame(clip, t, pix_fmt, copy=False):
+    """
+    Composite the frame at t and convert it for the pipe. Returns (frame, data).
+    copy=True detaches the frame from buffers the clip may reuse for its next
+    frame, so it stays valid while queued.
+    """
+    frame = clip.get_frame(t)
+    if frame.dtype != np.uint8 or copy:
+        frame = np.array(frame, dtype=np.uint8)
+    return frame, convert_frame(frame, pix_fmt)
+
+def produce_frames(clip, times, pix_fmt="rgb24", static_key=None, workers=1, depth=None):
+    """
+    Yield (t, frame, data) for every t in order.
+    With workers > 1, frames for upcoming timestamps are composited and
+    converted in a thread pool (numpy and PIL release the GIL in the heavy
+    parts) while at most depth frames are in flight; results are handed back
+    in timestamp order. static_key(t) marks spans of identical frames (see
+    write_outputs); only the first frame of such a span is rendered.
+    """
+    if workers <= 1:
+        last_key = None
+        frame = data = None
+        for t in times:
+            key = static_key(t) if static_key else None
+            if key is None or key != last_key:
+                frame, data = render_frame(clip, t, pix_fmt)
+            last_key = key
+            yield t, frame, data
+        return
+
+    depth = max(workers, depth or 2 * workers)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            last_key = None
+            last_future = None
+            for t in times:
+                key = static_key(t) if static_key else None
+                if key is None or key != last_key:
+                    last_future = pool.submit(render_frame, clip, t, pix_fmt, True)
+                last_key = key
+                pending.append((t, last_future))
+                # Repeats of a still share their future, so they cost no extra memory
+                while len(pending) > depth:
+                    t0, future = pending.popleft()
+                    frame, data = future.result()
+                    yield t0, frame, data
+            while pending:
+                t0, future = pending.popleft()
+                frame, data = future.result()
+                yield t0, frame, data
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+def write_outputs(clip, outputs, fps, logger=None, audiofile=None, pix_fmt="rgb24",
+                  static_key=None, observers=(), workers=1, depth=None, **encoder_args):
+    """
+    Composite each frame of clip once and feed it to every encoder.
+    outputs: list of (path, out_size); out_size None means the clip size.
+    pix_fmt "yuv420p" converts frames in numpy and halves the pipe traffic.
+    static_key(t) may return a hashable id for spans where the frame does not
+    change (a still slide); consecutive frames with the same id are
+    composited and converted once. observers(frame, t) see every frame.
+    workers/depth configure the threaded frame producer (see produce_frames).
+    """
+    size = tuple(clip.size)
+    if pix_fmt not in PIPE_FORMATS or size[0] % 2 or size[1] % 2:
+        pix_fmt = "rgb24"
+    logger = default_bar_logger(logger)
+    encoders = []
+    try:
+        for path, out_size in outputs:
+            encoders.append(FrameEncoder(path, size, fps, out_size=out_size, audiofile=audiofile,
+                                         pix_fmt=pix_fmt, **encoder_args))
+        times = logger.iter_bar(t=np.arange(0, clip.duration, 1.0 / fps))
+        with closing(produce_frames(clip, times, pix_fmt, static_key, workers, depth)) as frames:
+            for t, frame, data in frames:
+                for observer in observers:
+                    observer(frame, t)
+                for encoder in encoders:
+                    encoder.write_frame(data)
+    except BaseException:
+        for encoder in encoders:
+            encoder.kill()
+        raise
+    # A failed close must not leave the remaining ffmpeg processes running
+    for index, encoder in enumerate(encoders):
+        try:
+            encoder.close()
+        except BaseException:
+            for other in encoders[index + 1:]:
+                other.kill()
+            raise
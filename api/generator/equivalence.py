@@ -0,0 +1,224 @@
+"""
+Visual equivalence harness for the generator's fast render paths.
+
+Renders a fixed set of synthetic jobs twice: once through the reference
+path, the clip composition generate_format used before the streaming
+timeline and the frame pipe (every clip built up front, concatenated with
+moviepy and written by write_videofile, with the plain moviepy transition
+and text builders), and once through generate_format with the candidate
+settings. Grabs frames at fixed timestamps from both videos and reports
+PSNR and SSIM per frame. Exits with status 1 if any frame is below the
+thresholds.
+
+    python equivalence.py [--candidate '{"pipeFormat": "yuv420p"}'] [--jobs fade,ripple]
+                          [--min-psnr 42] [--min-ssim 0.99] [--step 0.25]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+from moviepy.editor import VideoFileClip, ImageClip, concatenate_videoclips
+from benchmarks import synthetic_still
+from preprocess import preprocess_images
+from generator import generate_format, make_transition, create_text_overlay, is_aspect_match, make_panorama_clip
+
+# Default candidate: every fast path enabled
+CANDIDATE_SETTINGS = {
+    "fastPaths": True,
+    "pipeFormat": "yuv420p",
+    "frameWorkers": 4,
+    "preprocessCache": True,
+    "thumbnails": True
+}
+
+TEXT_OVERLAY = {
+    "enabled": True,
+    "title": "Sunny 2BR apartment",
+    "price": "$120,000",
+    "phone": "+995 555 12 34 56",
+    "position": "bottom-left",
+    "color": "white",
+    "showLogo": True
+}
+
+# name -> (size, image sizes, settings); non-matching aspect ratios become panoramas
+SYNTHETIC_JOBS = {
+    "fade": ((360, 640), [(360, 640)] * 3, {"transition": "fade", "textOverlay": TEXT_OVERLAY}),
+    "blur_crossfade": ((360, 360), [(360, 360)] * 3, {"transition": "blur_crossfade"}),
+    "ripple": ((360, 640), [(360, 640)] * 3, {"transition": "ripple"}),
+    "circle_open": ((360, 640), [(360, 640)] * 3, {"transition": "circle_open", "textOverlay": TEXT_OVERLAY}),
+    "spin_in": ((360, 640), [(360, 640)] * 3, {"transition": "spin_in"}),
+    "slide_left": ((640, 360), [(640, 360)] * 3, {"transition": "slide_left"}),
+    "panorama": ((360, 640), [(360, 640), (1600, 600), (360, 640)], {"transition": "wipe_left", "textOverlay": TEXT_OVERLAY}),
+    "cut": ((360, 450), [(360, 450), (900, 600), (360, 450)], {"transition": "cut", "textOverlay": TEXT_OVERLAY})
+}
+
+# Lossless encoding, so only the render paths differ between the two videos
+BASE_SETTINGS = {"fps": 30, "secondsPerImage": 1.5, "transitionDuration": 0.6, "crf": 0}
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+def box_mean(img, size):
+    """Mean over size x size windows (valid region) using an integral image."""
+    s = np.pad(img, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (s[size:, size:] - s[:-size, size:] - s[size:, :-size] + s[:-size, :-size]) / float(size * size)
+
+def ssim(a, b, window=7):
+    """SSIM of the luma planes with a uniform window, as skimage computes it by default."""
+    weights = np.array([0.299, 0.587, 0.114])
+    x = a[:, :, :3].astype(np.float64) @ weights
+    y = b[:, :, :3].astype(np.float64) @ weights
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    n = window * window
+    mx, my = box_mean(x, window), box_mean(y, window)
+    # Sample (co)variances, matching skimage's default
+    scale = n / (n - 1.0)
+    vx = (box_mean(x * x, window) - mx * mx) * scale
+    vy = (box_mean(y * y, window) - my * my) * scale
+    cxy = (box_mean(x * y, window) - mx * my) * scale
+    s = ((2 * mx * my + c1) * (2 * cxy + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(s.mean())
+
+def write_images(job_dir, image_sizes):
+    paths = []
+    for index, (w, h) in enumerate(image_sizes):
+        path = os.path.join(job_dir, f"image_{index}.jpg")
+        Image.fromarray(synthetic_still(w, h, index + 1)).save(path, quality=95)
+        paths.append(path)
+    return paths
+
+def render_reference(name, size, images, settings, work_dir):
+    """
+    Render a job the way generate_format did before the streaming timeline,
+    the frame producer and the raw-frame encoder: all clips up front,
+    concatenate_videoclips and write_videofile. No caches.
+    """
+    out_dir = os.path.join(work_dir, "reference")
+    temp_dir = os.path.join(out_dir, "temp")
+    os.makedirs(temp_dir, exist_ok=True)
+    w, h = size
+    fps = int(settings["fps"])
+    duration = float(settings["secondsPerImage"])
+    trans_duration = float(settings["transitionDuration"])
+    transition_type = settings.get("transition", "cut")
+    if duration <= trans_duration:
+        trans_duration = max(0.1, duration / 2)
+
+    panoramas = [not is_aspect_match(p, w, h) for p in images]
+    stills = iter(preprocess_images([p for p, pano in zip(images, panoramas) if not pano], temp_dir, w, h))
+    is_cut = transition_type == "cut"
+    clip_duration = duration if is_cut else duration + (2 * trans_duration)
+    main_clips = [
+        make_panorama_clip(path, clip_duration, w, h) if pano else ImageClip(next(stills)).set_duration(clip_duration)
+        for path, pano in zip(images, panoramas)
+    ]
+
+    if is_cut:
+        final_clip = concatenate_videoclips(main_clips, method="compose")
+    else:
+        sequence = []
+        for i, clip in enumerate(main_clips):
+            if i == 0:
+                sequence.append(clip.subclip(0, duration))
+                continue
+            c1 = main_clips[i - 1].subclip(duration, duration + trans_duration)
+            c2 = clip.subclip(0, trans_duration)
+            sequence.append(make_transition(transition_type, c1, c2, trans_duration, fps, fast=False))
+            sequence.append(clip.subclip(trans_duration, trans_duration + duration))
+        final_clip = concatenate_videoclips(sequence, method="compose")
+
+    final_clip_with_text = create_text_overlay(final_clip, settings.get("textOverlay", {}), w, h, fast=False)
+    out_path = os.path.join(out_dir, f"{name}_reference.mp4")
+    try:
+        final_clip_with_text.write_videofile(out_path, fps=fps, codec="libx264", audio=False, preset="medium",
+                                             ffmpeg_params=["-crf", str(settings.get("crf", 0))], logger=None)
+    finally:
+        final_clip.close()
+        for clip in main_clips:
+            clip.close()
+    return out_path
+
+def render(name, size, images, settings, work_dir, label):
+    out_dir = os.path.join(work_dir, label)
+    os.makedirs(out_dir, exist_ok=True)
+    result = generate_format(name, size, images, os.path.join(out_dir, "temp"), name, out_dir, settings)
+    return os.path.join(out_dir, result["file"])
+
+def compare_job(name, work_dir, candidate, step=0.25):
+    """Render one synthetic job with both settings and compare frames every step seconds."""
+    size, image_sizes, job_settings = SYNTHETIC_JOBS[name]
+    job_dir = os.path.join(work_dir, name)
+    os.makedirs(job_dir, exist_ok=True)
+    images = write_images(job_dir, image_sizes)
+
+    settings = dict(BASE_SETTINGS, **job_settings)
+    reference_path = render_reference(name, size, images, settings, job_dir)
+    # A cache of its own, so the run neither reads nor fills the shared one
+    candidate_settings = dict(settings, cacheDir=os.path.join(work_dir, "cache"))
+    candidate_settings.update(candidate)
+    candidate_path = render(name, size, images, candidate_settings, job_dir, "candidate")
+
+    frames = []
+    with VideoFileClip(reference_path) as ref, VideoFileClip(candidate_path) as cand:
+        duration = min(ref.duration, cand.duration)
+        for t in np.arange(step / 2, duration - 1.0 / settings["fps"], step):
+            a, b = ref.get_frame(t), cand.get_frame(t)
+            frames.append({"t": round(float(t), 3), "psnr": round(psnr(a, b), 2), "ssim": round(ssim(a, b), 4)})
+        durations = (round(ref.duration, 3), round(cand.duration, 3))
+    return {"job": name, "durations": durations, "frames": frames}
+
+def run(jobs, candidate, min_psnr, min_ssim, step=0.25, work_dir=None):
+    """Compare every job; returns (reports, passed)."""
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="lvids_equiv_")
+    reports = []
+    passed = True
+    try:
+        for name in jobs:
+            report = compare_job(name, work_dir, candidate, step)
+            failures = [f for f in report["frames"] if f["psnr"] < min_psnr or f["ssim"] < min_ssim]
+            report["minPsnr"] = min(f["psnr"] for f in report["frames"])
+            report["minSsim"] = min(f["ssim"] for f in report["frames"])
+            report["failures"] = failures
+            report["passed"] = not failures and report["durations"][0] == report["durations"][1]
+            passed = passed and report["passed"]
+            reports.append(report)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return reports, passed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidate", help="JSON settings merged over the default candidate settings")
+    parser.add_argument("--jobs", help="Comma-separated subset of: " + ",".join(SYNTHETIC_JOBS))
+    parser.add_argument("--min-psnr", type=float, default=42.0)
+    parser.add_argument("--min-ssim", type=float, default=0.99)
+    parser.add_argument("--step", type=float, default=0.25, help="Seconds between compared frames")
+    parser.add_argument("--keep", help="Directory to keep the rendered videos in")
+    args = parser.parse_args()
+
+    candidate = dict(CANDIDATE_SETTINGS)
+    if args.candidate:
+        candidate.update(json.loads(args.candidate))
+    jobs = args.jobs.split(",") if args.jobs else list(SYNTHETIC_JOBS)
+    unknown = [j for j in jobs if j not in SYNTHETIC_JOBS]
+    if unknown:
+        parser.error(f"Unknown job(s): {', '.join(unknown)}")
+
+    # Keep the generator's progress output off stdout
+    original_stdout = sys.stdout
+    sys.stdout = sys.stderr
+    reports, passed = run(jobs, candidate, args.min_psnr, args.min_ssim, args.step, args.keep)
+    sys.stdout = original_stdout
+    for report in reports:
+        print(json.dumps(report))
+    print(json.dumps({"passed": passed, "jobs": len(reports), "failed": [r["job"] for r in reports if not r["passed"]]}))
+    sys.exit(0 if passed else 1)
@@ -2,9 +2,14 @@ import sys
 import os
 import json
 import shutil
+import time
 import argparse
+import tempfile
+import hashlib
 import multiprocessing
-from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont, ImageColor
 import numpy as np
 
 # Monkey patch for Pillow 10+ which removed ANTIALIAS
@@ -15,11 +20,27 @@ if not hasattr(Image, 'ANTIALIAS'):
         Image.ANTIALIAS = Image.LANCZOS
 
 from moviepy.editor import ImageClip, CompositeVideoClip, concatenate_videoclips, AudioFileClip, CompositeAudioClip
-from preprocess import preprocess_images
+from preprocess import preprocess_images, preprocess_cache_key
+from panorama import prepare_panoramas, PanoramaClip
+from timeline import StreamingTimeline
+from cache import open_cache
+from thumbnails import FrameTap, thumbnail_names
+from spool import Spool, DEFAULT_LEASE_SECONDS, wait_summary
+from job_manifest import JobManifest, task_key, task_fingerprint, output_files
+from scheduler import priority_level, fair_order, PRIORITIES, YieldFile
+from encoder import (
+    parse_renditions, write_audio_track, write_outputs, container_params, FragmentWatcher, CONTAINERS, \
+    encoding_profile, encoding_params
+)
+from memory import (
+    probe_image_size, get_memory_budget, estimate_format_memory, plan_concurrency,
+    get_frame_workers, get_encoder_threads, MB
+)
 from transitions import (
     slide_transition, zoom_transition, wipe_transition,
     circle_transition, pixelate_transition, spin_transition, 
-    fly_transition, page_curl_transition, ripple_transition
+    fly_transition, page_curl_transition, ripple_transition,
+    crossfade_transition
 )
 
 FONT_FILE_MAP = {
@@ -67,6 +88,33 @@ ALLOWED_FORMATS = {
     "youtube": {"9x16", "16x9"}
 }
 
+PROJECT_FONT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'public', 'fonts')
+
+@lru_cache(maxsize=1)
+def get_project_font_index():
+    """Map lowercase font file names to paths under public/fonts; scanned once per process."""
+    if not os.path.isdir(PROJECT_FONT_DIR):
+        return None
+    project_font_index = {}
+    for root, _, files in os.walk(PROJECT_FONT_DIR):
+        for file_name in files:
+            key_name = file_name.lower()
+            if key_name not in project_font_index:
+                project_font_index[key_name] = os.path.join(root, file_name)
+    return project_font_index
+
+@lru_cache(maxsize=1)
+def font_stamp():
+    """Digest of the project fonts' names, sizes and mtimes; changes when a font file does."""
+    h = hashlib.sha256()
+    for key_name, path in sorted((get_project_font_index() or {}).items()):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        h.update(f"{key_name}:{st.st_size}:{st.st_mtime_ns}\n".encode("utf8"))
+    return h.hexdigest()
+
 def clean_temp(path):
     if os.path.exists(path):
         try:
@@ -75,12 +123,23 @@ def clean_temp(path):
         except Exception as e:
             print(f"Warning: Failed to clean temp {path}: {e}")
 
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Failed to remove {path}: {e}")
+
 from proglog import ProgressBarLogger
 
 class MyBarLogger(ProgressBarLogger):
-    def __init__(self, fmt):
+    def __init__(self, fmt, job_id=None):
         super().__init__()
         self.fmt = fmt
+        # Batch mode renders several jobs at once: ::PROGRESS::job::format::percent
+        self.prefix = f"{job_id}::{fmt}" if job_id else fmt
 
     def callback(self, **changes):
         pass
@@ -89,10 +148,73 @@ class MyBarLogger(ProgressBarLogger):
         if bar == 't' and 'total' in self.bars[bar]:
              percentage = (value / self.bars[bar]['total']) * 100
              # Print to stderr to capture in node
-             sys.stderr.write(f"::PROGRESS::{self.fmt}::{int(percentage)}\n")
+             sys.stderr.write(f"::PROGRESS::{self.prefix}::{int(percentage)}\n")
              sys.stderr.flush()
 
-def create_pil_text_clip(text, fontsize, color, stroke_width, width, height, align, position_y, position_x=None, font_family=None, font_key=None, letter_spacing=0, line_height=1.0, font_weight=None):
+def fragment_reporter(fmt, filename):
+    """FragmentWatcher callback: ::FRAGMENT::format::file::index::playable_bytes::seconds on stderr."""
+    def report(index, playable_bytes, seconds):
+        sys.stderr.write(f"::FRAGMENT::{fmt}::{filename}::{index}::{playable_bytes}::{seconds:.2f}\n")
+        sys.stderr.flush()
+    return report
+
+# Bump when the output of create_pil_text_clip's raster changes so cached lines are not reused
+TEXT_RASTER_VERSION = 2
+TEXT_RASTER_MEMO_SIZE = 64
+_text_raster_memo = OrderedDict()
+
+def text_raster_key(*parts):
+    return hashlib.sha256(repr((TEXT_RASTER_VERSION,) + parts).encode("utf-8")).hexdigest()
+
+def blend_text_stamps(planes, mask, stroke, fill_ink, stroke_ink):
+    """
+    Blend a glyph mask into planar RGBA uint16 planes (4, h, w) the way
+    ImageDraw.text does, once per outline offset in stroke_ink and then once
+    in fill_ink. mask is padded by stroke on every side. Uses Pillow's
+    rounding and its handling of transparent pixels, so the result is byte-identical to drawing the text
+    (2*stroke+1)^2 + 1 times, or once without a stroke.
+    """
+    h, w = planes.shape[1:]
+    ys, xs = np.nonzero(mask)
+    if len(ys) == 0:
+        return
+    # Only the rows/columns the stamps can reach
+    y0, y1 = max(0, ys.min() - 2 * stroke), min(h, ys.max() + 1)
+    x0, x1 = max(0, xs.min() - 2 * stroke), min(w, xs.max() + 1)
+    region = planes[:, y0:y1, x0:x1]
+    tmp = np.empty_like(region)
+    part = np.empty_like(region)
+    fill_ink = np.asarray(fill_ink, dtype=np.uint16)[:, None, None]
+    stroke_ink = np.asarray(stroke_ink, dtype=np.uint16)[:, None, None]
+
+    def stamp(m, ink):
+        # Pillow takes the ink colour outright where the canvas is fully transparent
+        fresh = (region[3] == 0) & (m > 0)
+        # (c * (255 - m) + ink * m + 128), then Pillow's DIV255; fits in uint16
+        np.multiply(region, 255 - m, out=tmp)
+        np.multiply(ink, m, out=part)
+        np.add(tmp, part, out=tmp)
+        np.add(tmp, 128, out=tmp)
+        np.right_shift(tmp, 8, out=part)
+        np.add(tmp, part, out=tmp)
+        np.right_shift(tmp, 8, out=region)
+        np.copyto(region[:3], ink[:3], where=fresh)
+
+    if stroke > 0:
+        for offset_x in range(-stroke, stroke + 1):
+            for offset_y in range(-stroke, stroke + 1):
+                top, left = stroke - offset_y + y0, stroke - offset_x + x0
+                stamp(mask[top:top + y1 - y0, left:left + x1 - x0], stroke_ink)
+    stamp(mask[stroke + y0:stroke + y1, stroke + x0:stroke + x1], fill_ink)
+
+def create_pil_text_clip(text, fontsize, color, stroke_width, width, height, align, position_y, position_x=None, font_family=None, font_key=None, letter_spacing=0, line_height=1.0, font_weight=None, cache=None, fast=True):
+    """
+    One line of text as an RGBA ImageClip of the frame width.
+    Rendered lines are kept in memory and, with a DiskCache, on disk, keyed by
+    everything that affects the raster. fast rasterises each glyph run once and
+    blends the outline stamps in numpy (blend_text_stamps); fast=False draws
+    the text (2*stroke+1)^2 times (the reference for equivalence.py).
+    """
     try:
         def contains_georgian(value):
             return any('\u10A0' <= ch <= '\u10FF' for ch in value)
@@ -100,15 +222,8 @@ def create_pil_text_clip(text, fontsize, color, stroke_width, width, height, ali
         def load_font(family, size, text_value, key_value):
             candidates = []
             font_dir = None
-            project_font_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'public', 'fonts')
-            project_font_index = None
-            if project_font_dir and os.path.isdir(project_font_dir):
-                project_font_index = {}
-                for root, _, files in os.walk(project_font_dir):
-                    for file_name in files:
-                        key_name = file_name.lower()
-                        if key_name not in project_font_index:
-                            project_font_index[key_name] = os.path.join(root, file_name)
+            project_font_dir = PROJECT_FONT_DIR
+            project_font_index = get_project_font_index()
             if os.name == 'nt':
                 windir = os.environ.get('WINDIR', 'C:\\Windows')
                 font_dir = os.path.join(windir, 'Fonts')
@@ -196,6 +311,27 @@ def create_pil_text_clip(text, fontsize, color, stroke_width, width, height, ali
             height = max_y - min_y if not first else 0
             return total_w, height, min_y, max_y
 
+        def draw_text_composited(canvas, value, start_x, start_y, font_obj, fill_color, stroke, stroke_fill, spacing):
+            # Same pixels as draw_text_with_spacing on canvas, but each glyph run is
+            # rasterised once and the outline stamps are blended in numpy.
+            draw_obj = ImageDraw.Draw(canvas)
+            pieces = [(start_x, value)]
+            if spacing > 0:
+                pieces = []
+                current_x = start_x
+                for ch in value:
+                    pieces.append((current_x, ch))
+                    bbox = draw_obj.textbbox((0, 0), ch, font=font_obj)
+                    current_x += (bbox[2] - bbox[0]) + spacing
+            planes = np.array(canvas, dtype=np.uint16).transpose(2, 0, 1).copy()
+            fill_ink = ImageColor.getcolor(fill_color, 'RGBA')
+            stroke_ink = ImageColor.getcolor(stroke_fill, 'RGBA')
+            for piece_x, piece in pieces:
+                mask = Image.new('L', (canvas.width + 2 * stroke, canvas.height + 2 * stroke), 0)
+                ImageDraw.Draw(mask).text((piece_x + stroke, start_y + stroke), piece, font=font_obj, fill=255)
+                blend_text_stamps(planes, np.array(mask, dtype=np.uint16), stroke, fill_ink, stroke_ink)
+            canvas.paste(Image.fromarray(np.ascontiguousarray(planes.transpose(1, 2, 0)).astype(np.uint8), 'RGBA'))
+
         def draw_text_with_spacing(draw_obj, value, start_x, start_y, font_obj, fill_color, stroke, stroke_fill, spacing):
             if spacing <= 0:
                 if stroke > 0:
@@ -215,6 +351,24 @@ def create_pil_text_clip(text, fontsize, color, stroke_width, width, height, ali
                 current_x += (bbox[2] - bbox[0]) + spacing
 
         font = load_font(font_family, fontsize, text, font_key)
+        x_pos = 'center' if position_x is None else position_x
+
+        key = text_raster_key(text, getattr(font, "path", "default"), fontsize, stroke_width, letter_spacing,
+                              color, width, align, bool(fast))
+        raster = _text_raster_memo.get(key)
+        if raster is None and cache is not None and cache.get(key, ".png"):
+            try:
+                with Image.open(cache.path_for(key, ".png")) as cached_img:
+                    raster = np.array(cached_img.convert('RGBA'))
+            except (OSError, ValueError) as e:
+                # Evicted or damaged since the lookup: render the line again rather than drop it
+                print(f"Warning: text cache read failed, rendering again: {e}")
+                raster = None
+        if raster is not None:
+            _text_raster_memo[key] = raster
+            _text_raster_memo.move_to_end(key)
+            return ImageClip(raster).set_position((x_pos, position_y))
+
         temp_img = Image.new('RGBA', (10, 10), (0, 0, 0, 0))
         temp_draw = ImageDraw.Draw(temp_img)
         text_w, text_h, min_y, _ = measure_text(temp_draw, text, font, letter_spacing)
@@ -232,16 +386,33 @@ def create_pil_text_clip(text, fontsize, color, stroke_width, width, height, ali
             x = width - text_w - padding
 
         y = padding_y + stroke_width - min_y
-        draw_text_with_spacing(draw, text, x, y, font, color, stroke_width, 'black', letter_spacing)
-
-        x_pos = 'center' if position_x is None else position_x
-        return ImageClip(np.array(img)).set_position((x_pos, position_y))
+        if fast:
+            draw_text_composited(img, text, x, y, font, color, stroke_width, 'black', letter_spacing)
+        else:
+            draw_text_with_spacing(draw, text, x, y, font, color, stroke_width, 'black', letter_spacing)
+
+        raster = np.array(img)
+        _text_raster_memo[key] = raster
+        while len(_text_raster_memo) > TEXT_RASTER_MEMO_SIZE:
+            _text_raster_memo.popitem(last=False)
+        if cache is not None:
+            temp_path = cache.temp_path(key, ".png")
+            try:
+                img.save(temp_path, format="PNG")
+                cache.commit(temp_path, key, ".png")
+            except OSError as e:
+                # The line is rendered; only caching it failed
+                print(f"Warning: could not cache text line: {e}")
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return ImageClip(raster).set_position((x_pos, position_y))
     except Exception as e:
         print(f"Error creating text clip: {e}")
         return None
 
-def create_text_overlay(clip, textOverlay, width, height):
-    """Add text and logo overlay to clip"""
+def create_text_overlay(clip, textOverlay, width, height, cache=None, fast=True):
+    """Add text and logo overlay to clip; cache and fast are passed to create_pil_text_clip"""
     if not textOverlay.get('enabled', False):
         print("DEBUG: Text overlay disabled")
         return clip
@@ -329,15 +500,8 @@ def create_text_overlay(clip, textOverlay, width, height):
     def load_font_for_measure(size, text_value):
         candidates = []
         font_dir = None
-        project_font_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'public', 'fonts')
-        project_font_index = None
-        if project_font_dir and os.path.isdir(project_font_dir):
-            project_font_index = {}
-            for root, _, files in os.walk(project_font_dir):
-                for file_name in files:
-                    key_name = file_name.lower()
-                    if key_name not in project_font_index:
-                        project_font_index[key_name] = os.path.join(root, file_name)
+        project_font_dir = PROJECT_FONT_DIR
+        project_font_index = get_project_font_index()
         if os.name == 'nt':
             windir = os.environ.get('WINDIR', 'C:\\Windows')
             font_dir = os.path.join(windir, 'Fonts')
@@ -550,7 +714,9 @@ def create_text_overlay(clip, textOverlay, width, height):
             font_key=font_key,
             letter_spacing=spacing,
             line_height=line_height,
-            font_weight=weight
+            font_weight=weight,
+            cache=cache,
+            fast=fast
         )
         if clip_item:
             clip_item = clip_item.set_duration(clip.duration)
@@ -571,7 +737,9 @@ def create_text_overlay(clip, textOverlay, width, height):
             align='right', # Force right align for logo
             position_y=30,
             font_family=font_family,
-            font_key=font_key
+            font_key=font_key,
+            cache=cache,
+            fast=fast
         )
         if logo_clip:
             # Override position for top-right specifically
@@ -617,7 +785,78 @@ def make_panorama_clip(image_path, duration, target_w, target_h):
         return CompositeVideoClip([base.set_position(move)], size=(target_w, target_h)).set_duration(duration)
     return base
 
-def generate_format(fmt_key, dimensions, images, temp_base, property_id, output_dir, settings, platform_name=None):
+def make_transition(transition_type, c1, c2, trans_duration, fps=None, fast=True):
+    """
+    Build the transition clip from the tail of c1 to the head of c2.
+    fast=False renders crossfades through moviepy's compositing instead of the
+    integer kernel (the reference path for equivalence.py).
+    """
+    if not fast and transition_type in ("fade", "blur_crossfade"):
+        return CompositeVideoClip([c1, c2.crossfadein(trans_duration)], size=c1.size).set_duration(trans_duration)
+    if transition_type == "fade":
+        return crossfade_transition(c1, c2, trans_duration, fps)
+    elif transition_type == "slide_left":
+        return slide_transition(c1, c2, trans_duration, 'left')
+    elif transition_type == "slide_right":
+        return slide_transition(c1, c2, trans_duration, 'right')
+    elif transition_type == "slide_up":
+        return slide_transition(c1, c2, trans_duration, 'up')
+    elif transition_type == "slide_down":
+        return slide_transition(c1, c2, trans_duration, 'down')
+    elif transition_type == "zoom_in":
+        return zoom_transition(c1, c2, trans_duration, 'in')
+    elif transition_type == "zoom_out":
+        return zoom_transition(c1, c2, trans_duration, 'out')
+    elif transition_type == "wipe_left":
+        return wipe_transition(c1, c2, trans_duration, 'left')
+    elif transition_type == "wipe_right":
+        return wipe_transition(c1, c2, trans_duration, 'right')
+    elif transition_type == "wipe_up":
+        return wipe_transition(c1, c2, trans_duration, 'up')
+    elif transition_type == "wipe_down":
+        return wipe_transition(c1, c2, trans_duration, 'down')
+    elif transition_type == "circle_open":
+        return circle_transition(c1, c2, trans_duration, 'open')
+    elif transition_type == "circle_close":
+        return circle_transition(c1, c2, trans_duration, 'close')
+    elif transition_type == "pixelate":
+        return pixelate_transition(c1, c2, trans_duration)
+    elif transition_type == "spin_in":
+        return spin_transition(c1, c2, trans_duration, 'in')
+    elif transition_type == "spin_out":
+        return spin_transition(c1, c2, trans_duration, 'out')
+    elif transition_type == "fly_in":
+        return fly_transition(c1, c2, trans_duration, 'in')
+    elif transition_type == "fly_out":
+        return fly_transition(c1, c2, trans_duration, 'out')
+    elif transition_type == "page_curl":
+        return page_curl_transition(c1, c2, trans_duration)
+    elif transition_type == "ripple":
+        return ripple_transition(c1, c2, trans_duration)
+
+    # Mapped Fallbacks for missing transitions
+    elif transition_type == "luma_wipe":
+        return wipe_transition(c1, c2, trans_duration, 'left')
+    elif transition_type == "glitch":
+        return pixelate_transition(c1, c2, trans_duration)
+    elif transition_type == "cube3d":
+        return spin_transition(c1, c2, trans_duration, 'in')
+    elif transition_type == "flip3d":
+        return spin_transition(c1, c2, trans_duration, 'out')
+    elif transition_type == "blur_crossfade":
+        return crossfade_transition(c1, c2, trans_duration, fps)
+    elif transition_type == "directional_blur_wipe":
+        return wipe_transition(c1, c2, trans_duration, 'right')
+
+    # Default cut
+    return concatenate_videoclips([c1, c2])
+
+def generate_format(fmt_key, dimensions, images, temp_base, property_id, output_dir, settings, platform_name=None, preprocess_workers=None, checkpoint=None, progress_job=None):
+    """
+    Render one format. checkpoint() is called between timeline segments;
+    it may block to let more urgent work run (see run_spool_worker).
+    progress_job prefixes the progress lines with a job id (batch mode).
+    """
     w, h = dimensions
     fps = int(settings.get("fps", 30))
     duration = float(settings.get("secondsPerImage", 3.0))
@@ -626,6 +865,8 @@ def generate_format(fmt_key, dimensions, images, temp_base, property_id, output_
     music_volume = float(settings.get("musicVolume", 0.5))
     trans_duration = float(settings.get("transitionDuration", 0.8))
     text_overlay = settings.get("textOverlay", {})
+    # False selects the plain moviepy render paths, for equivalence checks
+    fast_paths = settings.get("fastPaths", True)
     
     # DEBUG
     print(f"DEBUG generate_format: fmt_key={fmt_key}, platform_name={platform_name}")
@@ -640,112 +881,54 @@ def generate_format(fmt_key, dimensions, images, temp_base, property_id, output_
     fmt_temp_dir = os.path.join(temp_base, f"{fmt_key}_{platform_suffix}")
     os.makedirs(fmt_temp_dir, exist_ok=True)
     
-    proc_images = preprocess_images(images, fmt_temp_dir, w, h)
+    cache = None
+    panorama_cache = None
+    if settings.get("preprocessCache", True):
+        cache = open_cache(settings, "preprocess")
+        panorama_cache = open_cache(settings, "panorama")
+    # Panoramas pan across the original, so they get no processed still
+    panoramas = [not is_aspect_match(p, w, h) for p in images]
+    stills = iter(preprocess_images([p for p, pano in zip(images, panoramas) if not pano], fmt_temp_dir, w, h,
+                                    max_workers=preprocess_workers, cache=cache))
+    proc_images = [None if pano else next(stills) for pano in panoramas]
+    # Scaled once, in strips, into raw files that the pan reads window by window
+    panorama_sources = {}
+    if fast_paths:
+        pano_indices = [i for i, pano in enumerate(panoramas) if pano]
+        sources = prepare_panoramas([images[i] for i in pano_indices], fmt_temp_dir, w, h,
+                                    max_workers=preprocess_workers, cache=panorama_cache)
+        panorama_sources = dict(zip(pano_indices, sources))
     
-    # 2. Create Clips logic
-    main_clips = []
+    # 2. Build the timeline; clips are created lazily while rendering
     is_cut = transition_type == "cut"
     clip_duration = duration if is_cut else duration + (2 * trans_duration)
-    
-    for index, (img_path, original_path) in enumerate(zip(proc_images, images)):
-        if not is_aspect_match(original_path, w, h):
-            clip = make_panorama_clip(original_path, clip_duration, w, h)
-        else:
-            clip = ImageClip(img_path).set_duration(clip_duration)
-        main_clips.append(clip)
-    
-    # 3. Concatenate
-    if transition_type == "cut":
-        final_clip = concatenate_videoclips(main_clips, method="compose")
-    else:
-        # Custom transitions logic
-        final_clips_sequence = []
-        for i in range(len(main_clips)):
-            current_clip = main_clips[i]
-            
-            if i == 0:
-                body = current_clip.subclip(0, duration)
-                final_clips_sequence.append(body)
-            else:
-                prev_clip_ref = main_clips[i-1]
-                c1 = prev_clip_ref.subclip(duration, duration + trans_duration)
-                c2 = current_clip.subclip(0, trans_duration)
-                
-                # Generate Transition
-                trans = None
-                if transition_type == "fade":
-                    trans = concatenate_videoclips([c1, c2], method="compose", padding=-trans_duration)
-                elif transition_type == "slide_left":
-                    trans = slide_transition(c1, c2, trans_duration, 'left')
-                elif transition_type == "slide_right":
-                    trans = slide_transition(c1, c2, trans_duration, 'right')
-                elif transition_type == "slide_up":
-                    trans = slide_transition(c1, c2, trans_duration, 'up')
-                elif transition_type == "slide_down":
-                    trans = slide_transition(c1, c2, trans_duration, 'down')
-                elif transition_type == "zoom_in":
-                    trans = zoom_transition(c1, c2, trans_duration, 'in')
-                elif transition_type == "zoom_out":
-                    trans = zoom_transition(c1, c2, trans_duration, 'out')
-                elif transition_type == "wipe_left":
-                    trans = wipe_transition(c1, c2, trans_duration, 'left')
-                elif transition_type == "wipe_right":
-                    trans = wipe_transition(c1, c2, trans_duration, 'right')
-                elif transition_type == "wipe_up":
-                    trans = wipe_transition(c1, c2, trans_duration, 'up')
-                elif transition_type == "wipe_down":
-                    trans = wipe_transition(c1, c2, trans_duration, 'down')
-                elif transition_type == "circle_open":
-                    trans = circle_transition(c1, c2, trans_duration, 'open')
-                elif transition_type == "circle_close":
-                    trans = circle_transition(c1, c2, trans_duration, 'close')
-                elif transition_type == "pixelate":
-                    trans = pixelate_transition(c1, c2, trans_duration)
-                elif transition_type == "spin_in":
-                    trans = spin_transition(c1, c2, trans_duration, 'in')
-                elif transition_type == "spin_out":
-                    trans = spin_transition(c1, c2, trans_duration, 'out')
-                elif transition_type == "fly_in":
-                    trans = fly_transition(c1, c2, trans_duration, 'in')
-                elif transition_type == "fly_out":
-                    trans = fly_transition(c1, c2, trans_duration, 'out')
-                elif transition_type == "page_curl":
-                    trans = page_curl_transition(c1, c2, trans_duration)
-                elif transition_type == "ripple":
-                    trans = ripple_transition(c1, c2, trans_duration)
-                
-                # Mapped Fallbacks for missing transitions
-                elif transition_type == "luma_wipe":
-                    trans = wipe_transition(c1, c2, trans_duration, 'left')
-                elif transition_type == "glitch":
-                    trans = pixelate_transition(c1, c2, trans_duration)
-                elif transition_type == "cube3d":
-                    trans = spin_transition(c1, c2, trans_duration, 'in')
-                elif transition_type == "flip3d":
-                    trans = spin_transition(c1, c2, trans_duration, 'out')
-                elif transition_type == "blur_crossfade":
-                    trans = concatenate_videoclips([c1, c2], method="compose", padding=-trans_duration)
-                elif transition_type == "directional_blur_wipe":
-                    trans = wipe_transition(c1, c2, trans_duration, 'right')
-                
-                else:
-                    # Default cut
-                    trans = concatenate_videoclips([c1, c2])
 
-                final_clips_sequence.append(trans)
-                
-                start = trans_duration
-                end = trans_duration + duration
-                
-                body = current_clip.subclip(start, end)
-                final_clips_sequence.append(body)
-        
-        final_clip = concatenate_videoclips(final_clips_sequence, method="compose")
+    def load_clip(index):
+        if index in panorama_sources:
+            return PanoramaClip(panorama_sources[index], clip_duration, w, h)
+        if panoramas[index]:
+            return make_panorama_clip(images[index], clip_duration, w, h)
+        return ImageClip(proc_images[index]).set_duration(clip_duration)
+
+    # 3. Concatenate
+    timeline = StreamingTimeline(
+        len(proc_images),
+        load_clip,
+        duration,
+        trans_duration,
+        make_transition=None if is_cut else lambda c1, c2, d: make_transition(transition_type, c1, c2, d, fps, fast_paths)
+    )
+    final_clip = timeline.to_clip()
     
     # 4. Add Text Overlay (if enabled)
     # Apply text overlay to the final concatenated clip instead of individual clips
     # This ensures text stays on top of transitions
-    final_clip_with_text = create_text_overlay(final_clip, text_overlay, w, h)
+    text_cache = None
+    if settings.get("textCache", True):
+        text_cache = open_cache(settings, "text")
+    final_clip_with_text = create_text_overlay(final_clip, text_overlay, w, h, cache=text_cache, fast=fast_paths)
+    if text_cache is not None:
+        text_cache.evict()
     
     # 5. Add Music (if provided)
     if music_file and os.path.exists(music_file):
@@ -770,91 +953,535 @@ def generate_format(fmt_key, dimensions, images, temp_base, property_id, output_
     else:
         out_filename = f"{property_id}_{fmt_key}.mp4"
     out_path = os.path.join(output_dir, out_filename)
+
+    # Tap the encoder's frame stream for the poster and thumbnail sprite
+    tap = None
+    if settings.get("thumbnails", True):
+        tap = FrameTap(
+            fps,
+            final_clip_with_text.duration,
+            poster_time=float(settings.get("posterTime", duration / 2)),
+            interval=float(settings.get("thumbnailInterval", 2.0)),
+            thumb_width=int(settings.get("thumbnailWidth", 160))
+        )
     
+    # Frames for upcoming timestamps are composited in threads, then encoded in order
+    frame_workers, frame_depth = get_frame_workers(settings)
+
+    # Extra renditions share the composited frame stream, only encoding is repeated
+    base_name = os.path.splitext(out_filename)[0]
+    renditions = parse_renditions(settings, fmt_key, w, h)
+    outputs = [(out_path, None)]
+    outputs += [(os.path.join(output_dir, f"{base_name}_{name}.mp4"), size) for name, size in renditions]
+
+    # Fragmented MP4 can be previewed while it is written; fragments are reported as they land
+    container = settings.get("container", "faststart")
+    if container not in CONTAINERS:
+        container = "faststart"
+    fragment_seconds = float(settings.get("fragmentSeconds", 2.0))
+    watchers = []
+    if container == "fragmented":
+        # A previous file at the same path would be parsed before ffmpeg truncates it
+        for path, _ in outputs:
+            if os.path.exists(path):
+                os.remove(path)
+        watchers = [FragmentWatcher(path, fps, fragment_reporter(fmt_key, os.path.basename(path))) for path, _ in outputs]
+
+    # Platform profile: bitrate/size cap, tune and GOP; keyframes at every slide start
+    profile_name, profile = encoding_profile(platform_name, settings)
+    video_duration = final_clip_with_text.duration
+    keyframe_times = timeline.slide_starts
+    if container == "fragmented":
+        # Fragments start at keyframes, so fragment boundaries are forced as well
+        keyframe_times = keyframe_times + list(np.arange(0, video_duration, fragment_seconds))
+        gop_seconds = profile.get("gopSeconds")
+        profile["gopSeconds"] = min(gop_seconds, fragment_seconds) if gop_seconds else fragment_seconds
+
     try:
-        final_clip_with_text.write_videofile(
-            out_path, 
-            fps=fps, 
-            codec="libx264", 
-            audio_codec="aac" if music_file else None,
-            audio=bool(music_file),
-            preset="medium",
-            ffmpeg_params=["-crf", "18"],
-            threads=max(1, os.cpu_count() or 1),
-            logger=MyBarLogger(fmt_key)
+        audiofile = write_audio_track(final_clip_with_text, fmt_temp_dir) if music_file else None
+        write_outputs(
+            final_clip_with_text,
+            outputs,
+            fps,
+            logger=MyBarLogger(fmt_key, progress_job),
+            audiofile=audiofile,
+            pix_fmt=settings.get("pipeFormat", "rgb24"),
+            # Text overlay and logo are static, so still slides repeat one frame
+            static_key=timeline.static_key if fast_paths else None,
+            observers=([tap] if tap else []) + watchers + ([timeline.boundary_observer(checkpoint)] if checkpoint else []),
+            workers=frame_workers,
+            depth=frame_depth,
+            codec="libx264",
+            audio_codec="aac",
+            preset=profile.get("preset") or "medium",
+            ffmpeg_params=encoding_params(profile, fps, video_duration, keyframe_times, audio=bool(audiofile))
+            + container_params(container, fps, fragment_seconds, keyframes=False),
+            threads=get_encoder_threads()
         )
-        return out_filename
+        for watcher in watchers:
+            watcher.poll()
+        result = {"format": fmt_key, "platform": platform_name, "file": out_filename, "profile": profile_name}
+        size_mb = os.path.getsize(out_path) / 1e6
+        if profile.get("maxSizeMb") and size_mb > float(profile["maxSizeMb"]):
+            print(f"Warning: {out_filename} is {size_mb:.1f} MB, over the {profile_name} cap of {profile['maxSizeMb']} MB")
+        if container == "fragmented":
+            result["fragments"] = watchers[0].count
+        if renditions:
+            result["renditions"] = [
+                {"name": name, "file": os.path.basename(path), "width": size[0], "height": size[1]}
+                for (name, size), (path, _) in zip(renditions, outputs[1:])
+            ]
+        if tap:
+            result.update(tap.save(output_dir, base_name, settings.get("posterFormat", "jpg")))
+        return result
+    except BaseException:
+        # A failed format leaves no truncated video or thumbnails behind
+        remove_files([path for path, _ in outputs] + [os.path.join(output_dir, f) for f in thumbnail_names(base_name)])
+        raise
     finally:
         final_clip.close()
-        for c in main_clips:
-            c.close()
+        timeline.close()
+
+def build_format_tasks(images, temp_base, property_id, output_dir, settings):
+    """Resolve enabled platforms to generate_format argument tuples."""
+    platforms = settings.get("platforms", {})
+    selected_formats = settings.get("formats", {})
+
+    print(f"DEBUG: platforms={platforms}")
+    print(f"DEBUG: selected_formats={selected_formats}")
 
-def generate_slideshow(images, property_id, output_dir, settings):
-    """Main generator function with multiprocessing."""
-    generated_files = []
+    tasks = []
+    for platform_id, enabled in platforms.items():
+        if not enabled:
+            continue
+        fmt_key = selected_formats.get(platform_id) or DEFAULT_FORMATS.get(platform_id)
+        allowed = ALLOWED_FORMATS.get(platform_id)
+        if allowed and fmt_key not in allowed:
+            fmt_key = DEFAULT_FORMATS.get(platform_id)
+        if not fmt_key:
+            continue
+        dimensions = FORMATS.get(fmt_key)
+        if not dimensions:
+            continue
+        platform_label = platform_id.upper()
+        tasks.append((fmt_key, dimensions, images, temp_base, property_id, output_dir, settings, platform_label))
+    return tasks
+
+def plan_format_pool(tasks, budget):
+    """
+    Admission control: size the format pool so concurrently rendering formats
+    fit the memory budget (bytes, or None if unknown).
+    Returns (num_processes, preprocess_workers).
+    """
+    size_cache = {}
+    estimates = []
+    for task in tasks:
+        task_images = task[2]
+        image_sizes = []
+        for p in task_images:
+            if p not in size_cache:
+                size_cache[p] = probe_image_size(p)
+            image_sizes.append(size_cache[p])
+        renditions = [size for _, size in parse_renditions(task[6], task[0], *task[1])]
+        estimates.append(estimate_format_memory(image_sizes, task[1], task[6], renditions))
+
+    num_processes, preprocess_workers = plan_concurrency(estimates, budget, min(4, multiprocessing.cpu_count()))
+    if budget:
+        peak = sum(sorted((r for r, _ in estimates), reverse=True)[:num_processes])
+        print(f"Memory budget {budget // MB}MB: running {num_processes} format(s) in parallel "
+              f"(estimated peak {peak // MB}MB), {preprocess_workers} preprocess thread(s) per format")
+        if peak > budget:
+            print("Warning: a single format is estimated to exceed the memory budget")
+        # For the API server: a job that runs while this one is paused gets the rest of the budget
+        sys.stderr.write(f"::MEMORY::{budget // MB}::{min(peak, budget) // MB}\n")
+        sys.stderr.flush()
+    return num_processes, preprocess_workers
+
+def generate_slideshow(images, property_id, output_dir, settings, checkpoint=None):
+    """
+    Main generator function with multiprocessing.
+    checkpoint (picklable, e.g. a scheduler.YieldFile) is passed to every
+    format and may pause it between timeline segments.
+    Each format succeeds or fails on its own; outcomes are recorded in the
+    job manifest (see job_manifest.py) as they arrive, so running the job
+    again into the same output directory only renders the formats that
+    failed, unless settings.reuse is false. Returns {"outputs": one dict per finished format (file, plus
+    poster/sprite when enabled), "formats": per-format status and timing,
+    "errors": {format: message}}.
+    """
+    outputs = []
+    formats = []
+    errors = {}
     temp_base = os.path.join(output_dir, "temp_proc")
     os.makedirs(temp_base, exist_ok=True)
     
     # DEBUG: Print what we received
     print(f"DEBUG: Settings received: {json.dumps(settings, indent=2)}")
     
-    # Get platforms and formats from settings
-    platforms = settings.get("platforms", {})
-    selected_formats = settings.get("formats", {})
-    
-    print(f"DEBUG: platforms={platforms}")
-    print(f"DEBUG: selected_formats={selected_formats}")
-    
     try:
-        tasks = []
-        for platform_id, enabled in platforms.items():
-            if not enabled:
-                continue
-            fmt_key = selected_formats.get(platform_id) or DEFAULT_FORMATS.get(platform_id)
-            allowed = ALLOWED_FORMATS.get(platform_id)
-            if allowed and fmt_key not in allowed:
-                fmt_key = DEFAULT_FORMATS.get(platform_id)
-            if not fmt_key:
-                continue
-            dimensions = FORMATS.get(fmt_key)
-            if not dimensions:
-                continue
-            platform_label = platform_id.upper()
-            tasks.append((fmt_key, dimensions, images, temp_base, property_id, output_dir, settings, platform_label))
+        tasks = build_format_tasks(images, temp_base, property_id, output_dir, settings)
         
         if not tasks:
             print("No formats selected by any platform!")
-            return []
-        
-        num_processes = min(4, multiprocessing.cpu_count())
-        
-        with multiprocessing.Pool(processes=num_processes) as pool:
-            results = pool.starmap(generate_format, tasks)
-            generated_files = [f for f in results if f]  # Filter out None values
+            return {"outputs": outputs, "formats": formats, "errors": errors}
+
+        manifest = JobManifest(output_dir, property_id)
+        fonts = font_stamp() if (settings.get("textOverlay") or {}).get("enabled") else None
+        fingerprints = {task_key(task): task_fingerprint(task, fonts) for task in tasks}
+        reuse = settings.get("reuse", True) is not False
+        pending = []
+        for task in tasks:
+            key = task_key(task)
+            output = manifest.completed(key, fingerprints[key]) if reuse else None
+            if output is None:
+                pending.append(task)
+                continue
+            print(f"Reusing {output['file']} from an earlier run")
+            outputs.append(output)
+            formats.append({"format": task[0], "platform": task[7], "status": "reused", "elapsed": 0.0})
+
+        if pending:
+            num_processes, preprocess_workers = plan_format_pool(pending, get_memory_budget(settings))
+            pending = [task + (preprocess_workers, checkpoint) for task in pending]
+            with multiprocessing.Pool(processes=num_processes) as pool:
+                for task, output, error, started, elapsed in pool.imap_unordered(run_format_task, pending):
+                    key = task_key(task)
+                    manifest.record(key, fingerprints[key], output=output, error=error, elapsed=elapsed)
+                    status = {"format": task[0], "platform": task[7], "status": "error" if error else "done",
+                              "elapsed": round(elapsed, 2)}
+                    if error:
+                        print(f"Format {key} failed: {error}")
+                        errors[key] = error
+                        status["error"] = error
+                    elif output:
+                        outputs.append(output)
+                    formats.append(status)
 
     finally:
         clean_temp(temp_base)
 
-    return generated_files
+    return {"outputs": outputs, "formats": formats, "errors": errors}
+
+def prewarm(images, settings=None):
+    """
+    Preprocess uploads into the persistent cache for the default formats (and
+    any formats selected in settings) before the real job arrives.
+    Returns a summary with how many stills were already cached.
+    """
+    settings = settings or {}
+    started = time.time()
+    format_keys = list(dict.fromkeys(list(DEFAULT_FORMATS.values()) + list((settings.get("formats") or {}).values())))
+    format_keys = [f for f in format_keys if f in FORMATS]
+    cache = open_cache(settings, "preprocess")
+    panorama_cache = open_cache(settings, "panorama")
+
+    # Header-only probes; panoramas are scaled into the panorama cache instead of a still
+    pano_flags = {f: [not is_aspect_match(p, *FORMATS[f]) for p in images] for f in format_keys}
+    panoramas = {f: sum(flags) for f, flags in pano_flags.items()}
+
+    cached = 0
+    temp_dir = tempfile.mkdtemp(prefix="lvids_prewarm_")
+    try:
+        for fmt_key in format_keys:
+            w, h = FORMATS[fmt_key]
+            stills = [p for p, pano in zip(images, pano_flags[fmt_key]) if not pano]
+            for p in stills:
+                ext = os.path.splitext(p)[1].lower() or ".jpg"
+                if os.path.exists(cache.path_for(preprocess_cache_key(p, w, h), ext)):
+                    cached += 1
+            # Results are linked out of the cache; only the cache entries are kept
+            fmt_temp_dir = os.path.join(temp_dir, fmt_key)
+            os.makedirs(fmt_temp_dir, exist_ok=True)
+            preprocess_images(stills, fmt_temp_dir, w, h, cache=cache)
+            prepare_panoramas([p for p, pano in zip(images, pano_flags[fmt_key]) if pano], fmt_temp_dir, w, h,
+                              cache=panorama_cache)
+    finally:
+        clean_temp(temp_dir)
+
+    return {
+        "status": "success",
+        "prewarm": True,
+        "images": len(images),
+        "formats": format_keys,
+        "alreadyCached": cached,
+        "panoramas": panoramas,
+        "elapsed": round(time.time() - started, 2)
+    }
+
+def run_format_task(task, progress_job=None):
+    """Pool entry point: render one format, never raises. Returns (task, output, error, started, elapsed)."""
+    started = time.time()
+    try:
+        output, error = generate_format(*task, progress_job=progress_job), None
+    except Exception as e:
+        output, error = None, str(e)
+    return task, output, error, started, time.time() - started
+
+def run_batch_task(item):
+    """Pool entry point for batch mode: never raises, reports the outcome and when it started instead."""
+    job_index, task = item
+    _, output, error, started, _ = run_format_task(task, progress_job=task[4])
+    return job_index, task_key(task), output, error, started
+
+def load_batch_manifest(manifest_path):
+    """
+    Read a batch manifest: either a list of jobs or {"output": dir, "settings": {...}, "jobs": [...]}.
+    Each job needs an id and images; output defaults to <manifest output>/<id> and
+    settings are merged over the manifest-level defaults. Relative image and
+    output paths are resolved against the manifest's directory.
+    """
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    default_output = os.path.join(base_dir, manifest.get("output") or "outputs")
+    default_settings = manifest.get("settings") or {}
+
+    jobs = []
+    for entry in manifest.get("jobs", []):
+        property_id = str(entry.get("id") or entry.get("propertyId") or entry.get("property_id") or "")
+        images = entry.get("images") or []
+        if not property_id or not images:
+            raise ValueError(f"Batch entry {len(jobs)} needs an id and images")
+        settings = dict(default_settings)
+        settings.update(entry.get("settings") or {})
+        jobs.append({
+            "id": property_id,
+            "images": [os.path.join(base_dir, p) if not os.path.isabs(p) else p for p in images],
+            "output": os.path.join(base_dir, entry["output"]) if entry.get("output") else os.path.join(default_output, property_id),
+            "settings": settings
+        })
+    return jobs
+
+def batch_memory_budget(jobs):
+    """One pool runs every job's formats, so the tightest job budget applies to all of them."""
+    budgets = [b for b in (get_memory_budget(job["settings"]) for job in jobs) if b]
+    return min(budgets) if budgets else None
+
+def generate_batch(jobs, emit):
+    """
+    Render many jobs through one shared format pool.
+    Formats are started by priority (settings.priority), round-robin across
+    jobs of the same priority (see scheduler.py). The pool shares one memory
+    budget, the smallest any job asks for (see batch_memory_budget).
+    emit(dict) receives one result per job as it completes, in completion order,
+    with how long its formats waited for a pool slot.
+    Returns the batch summary.
+    """
+    started = time.time()
+    tasks = []
+    pending = {}
+    results = {}
+    for job_index, job in enumerate(jobs):
+        os.makedirs(job["output"], exist_ok=True)
+        job["temp"] = os.path.join(job["output"], "temp_proc")
+        os.makedirs(job["temp"], exist_ok=True)
+        job_tasks = build_format_tasks(job["images"], job["temp"], job["id"], job["output"], job["settings"])
+        results[job_index] = {"id": job["id"], "files": [], "outputs": [], "errors": {}, "waits": [], "started": time.time()}
+        pending[job_index] = len(job_tasks)
+        level = priority_level(job["settings"])
+        tasks.extend((level, job_index, (job_index, task)) for task in job_tasks)
+    tasks = fair_order(tasks)
+
+    def finish(job_index):
+        job = jobs[job_index]
+        result = results[job_index]
+        clean_temp(job["temp"])
+        elapsed = time.time() - result.pop("started")
+        wait = wait_summary(result.pop("waits"))
+        if result["errors"] or not result["files"]:
+            message = "; ".join(f"{fmt}: {err}" for fmt, err in result["errors"].items()) or "No formats selected by any platform!"
+            emit({"status": "error", "id": job["id"], "files": result["files"], "outputs": result["outputs"],
+                  "message": message, "elapsed": round(elapsed, 2), "wait": wait})
+        else:
+            emit({"status": "success", "id": job["id"], "files": result["files"], "outputs": result["outputs"],
+                  "elapsed": round(elapsed, 2), "wait": wait})
+
+    totals = dict(pending)
+    for job_index, count in totals.items():
+        if count == 0:
+            finish(job_index)
+
+    if tasks:
+        num_processes, preprocess_workers = plan_format_pool([task for _, task in tasks], batch_memory_budget(jobs))
+        indexed = [(job_index, task + (preprocess_workers,)) for job_index, task in tasks]
+        with multiprocessing.Pool(processes=num_processes) as pool:
+            for job_index, key, output, error, task_started in pool.imap_unordered(run_batch_task, indexed):
+                result = results[job_index]
+                result["waits"].append({"waited": task_started - started})
+                if error:
+                    # Platforms can share a format, so errors are keyed by platform and format
+                    result["errors"][key] = error
+                elif output:
+                    result["files"].extend(output_files(output))
+                    result["outputs"].append(output)
+                pending[job_index] -= 1
+                total = totals[job_index]
+                sys.stderr.write(f"::JOB::{jobs[job_index]['id']}::{total - pending[job_index]}::{total}\n")
+                sys.stderr.flush()
+                if pending[job_index] == 0:
+                    finish(job_index)
+
+    elapsed = time.time() - started
+    videos = sum(len(r["files"]) for r in results.values())
+    failed = sum(1 for r in results.values() if r["errors"] or not r["files"])
+    return {
+        "status": "success" if failed == 0 else "error",
+        "batch": True,
+        "jobs": len(jobs),
+        "failed": failed,
+        "videos": videos,
+        "elapsed": round(elapsed, 2),
+        "videosPerHour": round(videos * 3600.0 / elapsed, 1) if elapsed > 0 else 0.0
+    }
+
+def submit_spool_job(spool, images, property_id, output_dir, settings):
+    """Queue a job in the spool directory, one task per enabled format. Returns the spool job id."""
+    tasks = build_format_tasks(images, None, property_id, output_dir, settings)
+    job = {"id": property_id, "images": images, "output": output_dir, "settings": settings}
+    return spool.submit(job, [f"{task[7]}_{task[0]}" for task in tasks])
+
+def run_spool_task(spool, claim, preemptible=False):
+    """
+    Render one claimed spool task and record its result. A preemptible task
+    checks the spool between timeline segments and renders any more urgent
+    pending task in place before continuing. Returns the number of tasks
+    rendered, including those.
+    """
+    job = spool.load_job(claim.job_id)
+    if job is None:
+        spool.complete(claim, {"error": "Job description is missing"})
+        return 1
+    print(f"Worker claimed {claim.job_id} task {claim.index} (attempt {claim.attempt}, waited {claim.waited:.1f}s)")
+    preempted = [0.0]
+    rendered = [1]
+
+    def checkpoint():
+        while True:
+            urgent = spool.claim(max_level=claim.level - 1)
+            if urgent is None:
+                return
+            paused = time.time()
+            print(f"Pausing {claim.job_id} task {claim.index} for {urgent.job_id} task {urgent.index}")
+            rendered[0] += run_spool_task(spool, urgent)
+            preempted[0] += time.time() - paused
+
+    temp_base = os.path.join(job["output"], f"temp_proc_{claim.index}")
+    try:
+        os.makedirs(temp_base, exist_ok=True)
+        tasks = build_format_tasks(job["images"], temp_base, job["id"], job["output"], job["settings"])
+        can_yield = preemptible and claim.level > min(PRIORITIES.values())
+        with spool.heartbeat(claim):
+            output = generate_format(*tasks[claim.index], checkpoint=checkpoint if can_yield else None)
+        spool.complete(claim, {"output": output, "files": output_files(output), "preempted": round(preempted[0], 3)})
+    except Exception as e:
+        spool.complete(claim, {"error": str(e), "preempted": round(preempted[0], 3)})
+    finally:
+        clean_temp(temp_base)
+    return rendered[0]
+
+def run_spool_worker(spool, poll_interval=2.0, once=False):
+    """
+    Claim and render spool tasks until the spool is empty (once) or forever.
+    Each task renders one format of a job into the job's output directory.
+    Tasks are claimed by priority and fair share (see scheduler.py); batch
+    tasks yield to interactive ones at segment boundaries.
+    """
+    rendered = 0
+    while True:
+        spool.requeue_stale()
+        claim = spool.claim()
+        if claim is None:
+            if once:
+                return rendered
+            time.sleep(poll_interval)
+            continue
+        rendered += run_spool_task(spool, claim, preemptible=True)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--images", nargs="+", required=True)
-    parser.add_argument("--id", required=True)
-    parser.add_argument("--output", required=True)
-    parser.add_argument("--settings", required=True)
+    parser.add_argument("--images", nargs="+")
+    parser.add_argument("--id")
+    parser.add_argument("--output")
+    parser.add_argument("--settings")
+    parser.add_argument("--force", action="store_true",
+                        help="Render every format, even those an earlier run into --output finished")
+    parser.add_argument("--yield-file",
+                        help="While this file exists, formats pause at their next segment boundary")
+    parser.add_argument("--batch", help="Path to a JSON manifest of jobs to render in one invocation")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="Preprocess --images into the cache for the default formats and exit")
+    parser.add_argument("--spool", help="Spool directory on shared storage: queue the job there instead of rendering it")
+    parser.add_argument("--worker", action="store_true", help="Render tasks claimed from --spool")
+    parser.add_argument("--once", action="store_true", help="With --worker, exit when no task is pending")
+    parser.add_argument("--poll", type=float, default=2.0, help="Seconds between spool polls")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="Seconds without a heartbeat before a claimed task is requeued")
     
     args = parser.parse_args()
+    if args.worker and not args.spool:
+        parser.error("--worker requires --spool")
+    if args.prewarm and not args.images:
+        parser.error("--prewarm requires --images")
+    if not args.batch and not args.worker and not args.prewarm and not (args.images and args.id and args.output and args.settings):
+        parser.error("--images, --id, --output and --settings are required unless --batch, --worker or --prewarm is given")
     
     original_stdout = sys.stdout
     sys.stdout = sys.stderr
+
+    if args.prewarm:
+        try:
+            summary = prewarm(args.images, json.loads(args.settings) if args.settings else {})
+            original_stdout.write(json.dumps(summary) + "\n")
+        except Exception as e:
+            original_stdout.write(json.dumps({"status": "error", "prewarm": True, "message": str(e)}) + "\n")
+        sys.exit(0)
+
+    if args.spool:
+        spool = Spool(args.spool, lease=args.lease)
+        try:
+            if args.worker:
+                rendered = run_spool_worker(spool, poll_interval=args.poll, once=args.once)
+                original_stdout.write(json.dumps({"status": "success", "worker": True, "tasks": rendered}) + "\n")
+            else:
+                output_dir = os.path.abspath(args.output)
+                images = [os.path.abspath(p) for p in args.images]
+                job_id = submit_spool_job(spool, images, args.id, output_dir, json.loads(args.settings))
+                original_stdout.write(json.dumps({"status": "queued", "job": job_id, "spool": args.spool}) + "\n")
+        except Exception as e:
+            original_stdout.write(json.dumps({"status": "error", "message": str(e)}) + "\n")
+        sys.exit(0)
+
+    if args.batch:
+        def emit(result):
+            original_stdout.write(json.dumps(result) + "\n")
+            original_stdout.flush()
+        try:
+            summary = generate_batch(load_batch_manifest(args.batch), emit)
+            emit(summary)
+        except Exception as e:
+            emit({"status": "error", "batch": True, "message": str(e)})
+        sys.exit(0)
     
     try:
         settings = json.loads(args.settings)
-        files = generate_slideshow(args.images, args.id, args.output, settings)
+        if args.force:
+            settings["reuse"] = False
+        checkpoint = YieldFile(args.yield_file) if args.yield_file else None
+        result = generate_slideshow(args.images, args.id, args.output, settings, checkpoint=checkpoint)
+        outputs = result["outputs"]
+        files = [f for o in outputs for f in output_files(o)]
         
         sys.stdout = original_stdout
-        print(json.dumps({"status": "success", "files": files}))
+        if result["errors"]:
+            # Finished formats are kept and listed; a rerun only renders the failed ones
+            message = "; ".join(f"{fmt}: {err}" for fmt, err in result["errors"].items())
+            print(json.dumps({"status": "error", "message": message, "files": files, "outputs": outputs,
+                              "formats": result["formats"]}))
+        else:
+            print(json.dumps({"status": "success", "files": files, "outputs": outputs, "formats": result["formats"]}))
     except Exception as e:
         sys.stdout = original_stdout
         print(json.dumps({"status": "error", "message": str(e)}))
@@ -0,0 +1,107 @@
+"""
+Per-job record of finished formats, kept next to the outputs.
+
+generate_slideshow writes <output>/<id>.manifest.json as each format task
+finishes or fails. When the same job is run again into the same output
+directory, formats recorded as done are reused instead of re-rendered,
+provided their inputs are unchanged (same images, same output-affecting
+settings, same generator code and fonts) and their files are still there.
+Only the formats that failed, or were never reached, are rendered again.
+settings.reuse = false (CLI --force) renders every format regardless.
+"""
+import os
+import sys
+import json
+import hashlib
+from functools import lru_cache
+from cache import file_digest
+from spool import write_json_atomic, read_json
+
+MANIFEST_VERSION = 1
+# Settings that affect scheduling, caching or which formats run, not the files of a format
+RUNTIME_SETTINGS = {
+    "priority", "platforms", "formats", "cacheDir", "cacheMaxMb", "preprocessCache", "textCache",
+    "memoryBudgetMb", "frameWorkers", "frameQueueDepth", "reuse"
+}
+
+@lru_cache(maxsize=1)
+def code_digest():
+    """Digest of the generator's code: its .py sources, or the executable when frozen."""
+    if getattr(sys, "frozen", False):
+        return file_digest(sys.executable)
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(code_dir)):
+        if name.endswith(".py"):
+            h.update(name.encode("utf8"))
+            h.update(file_digest(os.path.join(code_dir, name)).encode("ascii"))
+    return h.hexdigest()
+
+def task_key(task):
+    """Manifest key of a generate_format task tuple: platform and format, as in spool task names."""
+    return f"{task[7]}_{task[0]}"
+
+def task_fingerprint(task, fonts=None):
+    """
+    Digest of everything that determines a format's files: images, size,
+    settings and generator code. fonts identifies the font files available
+    to the text overlay (see generator.font_stamp).
+    """
+    fmt_key, dimensions, images, _, property_id, _, settings, platform = task[:8]
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        "version": MANIFEST_VERSION,
+        "code": code_digest(),
+        "fonts": fonts,
+        "format": fmt_key,
+        "platform": platform,
+        "dimensions": list(dimensions),
+        "id": property_id,
+        "settings": {k: v for k, v in settings.items() if k not in RUNTIME_SETTINGS}
+    }, sort_keys=True, default=str).encode("utf8"))
+    for path in images:
+        h.update(file_digest(path).encode("ascii"))
+    music = settings.get("musicFile")
+    if music and os.path.exists(music):
+        h.update(file_digest(music).encode("ascii"))
+    return h.hexdigest()
+
+def output_files(output, thumbnails=False):
+    """
+    Video files produced for one format: the main output and its renditions.
+    With thumbnails, the poster and sprite images as well.
+    """
+    files = [output["file"]] + [r["file"] for r in output.get("renditions", [])]
+    if thumbnails:
+        files += [output[k]["file"] for k in ("poster", "sprite") if output.get(k)]
+    return files
+
+class JobManifest:
+    def __init__(self, output_dir, property_id):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, f"{property_id}.manifest.json")
+        data = read_json(self.path, {}) or {}
+        self.formats = data.get("formats", {}) if data.get("version") == MANIFEST_VERSION else {}
+
+    def completed(self, key, fingerprint):
+        """The recorded output of a finished format if it can be reused, else None."""
+        entry = self.formats.get(key)
+        if not entry or entry.get("status") != "done" or entry.get("fingerprint") != fingerprint:
+            return None
+        output = entry.get("output")
+        if not output or not all(os.path.exists(os.path.join(self.output_dir, f)) for f in output_files(output, thumbnails=True)):
+            return None
+        return output
+
+    def record(self, key, fingerprint, output=None, error=None, elapsed=0.0):
+        """Record a format's outcome; attempts counts the renders of this format with these inputs."""
+        previous = self.formats.get(key) or {}
+        attempts = previous.get("attempts", 0) + 1 if previous.get("fingerprint") == fingerprint else 1
+        entry = {"status": "error" if error else "done", "fingerprint": fingerprint,
+                 "elapsed": round(elapsed, 2), "attempts": attempts}
+        if error:
+            entry["error"] = error
+        else:
+            entry["output"] = output
+        self.formats[key] = entry
+        write_json_atomic(self.path, {"version": MANIFEST_VERSION, "formats": self.formats})
@@ -0,0 +1,265 @@
+"""
+End-to-end load test: runs N synthetic jobs through the generator CLI,
+C at a time, the way the API server spawns them, and reports throughput,
+job latency percentiles, CPU utilisation and peak memory of the whole
+process tree (generators, their format workers and ffmpeg). Linux only
+(reads /proc).
+
+    python loadtest.py [--jobs 8] [--concurrency 2] [--images 5] [--image-size 1600x1200]
+                       [--platforms tiktok,instagram] [--transition fade] [--text]
+                       [--fps 30] [--seconds-per-image 3] [--interval 0] [--settings '{...}']
+                       [--output result.json] [--baseline result.json] [--tolerance 10]
+
+--interval spaces job arrivals (open loop); latency is then measured from
+arrival, so it includes time spent waiting for a free slot. With
+--baseline, exits with status 1 if jobs/hour dropped or p95 latency rose
+by more than --tolerance percent.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess as sp
+from collections import deque
+import numpy as np
+from PIL import Image
+from benchmarks import synthetic_still
+from equivalence import TEXT_OVERLAY
+
+GENERATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generator.py")
+SAMPLE_INTERVAL = 0.2
+
+def parse_size(value):
+    w, h = value.lower().split("x")
+    return int(w), int(h)
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2) if values else None
+
+def cpu_times():
+    """(busy, total) jiffies over all CPUs from /proc/stat."""
+    with open("/proc/stat") as f:
+        fields = [int(v) for v in f.readline().split()[1:]]
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    return sum(fields) - idle, sum(fields)
+
+def tree_rss(root_pid):
+    """Summed RSS in bytes of every descendant of root_pid."""
+    children = {}
+    rss = {}
+    page = os.sysconf("SC_PAGE_SIZE")
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{name}/statm") as f:
+                rss[int(name)] = int(f.read().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+        # Fields after the parenthesised command name; ppid is the second
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(name))
+    total = 0
+    stack = list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total
+
+class Sampler:
+    """Samples the process tree's RSS in a thread; keeps the peak and the mean."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._stop.wait(self.interval):
+            rss = tree_rss(pid)
+            self.peak = max(self.peak, rss)
+            self.samples.append(rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def make_job_images(job_dir, count, size, seed):
+    """Distinct synthetic stills per job, so jobs don't share preprocess cache entries."""
+    paths = []
+    for index in range(count):
+        path = os.path.join(job_dir, f"image_{index}.jpg")
+        Image.fromarray(synthetic_still(size[0], size[1], seed * 1000 + index)).save(path, quality=92)
+        paths.append(path)
+    return paths
+
+def job_settings(args, work_dir):
+    settings = {
+        "fps": args.fps,
+        "secondsPerImage": args.seconds_per_image,
+        "transition": args.transition,
+        "platforms": {p: True for p in args.platforms.split(",") if p},
+        # A private cache, so runs start cold and don't touch the shared one
+        "cacheDir": os.path.join(work_dir, "cache")
+    }
+    if args.text:
+        settings["textOverlay"] = TEXT_OVERLAY
+    if args.settings:
+        settings.update(json.loads(args.settings))
+    return settings
+
+def start_job(job, settings):
+    log = open(os.path.join(job["dir"], "generator.log"), "wb")
+    cmd = [sys.executable, GENERATOR, "--images", *job["images"], "--id", job["id"],
+           "--output", os.path.join(job["dir"], "out"), "--settings", json.dumps(settings)]
+    job["started"] = time.time()
+    job["proc"] = sp.Popen(cmd, stdout=sp.PIPE, stderr=log)
+    job["log"] = log
+
+def finish_job(job):
+    stdout = job["proc"].stdout.read().decode("utf8", errors="replace")
+    job["proc"].wait()
+    job["finished"] = time.time()
+    job["log"].close()
+    result = None
+    for line in reversed(stdout.strip().splitlines()):
+        try:
+            result = json.loads(line)
+            break
+        except ValueError:
+            continue
+    job["status"] = (result or {}).get("status", "error")
+    job["videos"] = len((result or {}).get("files") or [])
+    if job["status"] != "success":
+        job["message"] = (result or {}).get("message") or f"exit code {job['proc'].returncode}"
+
+def run(args, work_dir):
+    """Run the load test in work_dir; returns the report."""
+    settings = job_settings(args, work_dir)
+    size = parse_size(args.image_size)
+    jobs = []
+    for index in range(args.jobs):
+        job_dir = os.path.join(work_dir, f"job_{index}")
+        os.makedirs(job_dir)
+        jobs.append({"id": f"load{index}", "dir": job_dir, "images": make_job_images(job_dir, args.images, size, index + 1)})
+
+    waiting = deque(jobs)
+    running = []
+    busy_before, total_before = cpu_times()
+    children_before = os.times()
+    started = time.time()
+    for index, job in enumerate(jobs):
+        job["arrival"] = started + index * args.interval
+
+    with Sampler() as sampler:
+        while waiting or running:
+            now = time.time()
+            while waiting and len(running) < args.concurrency and waiting[0]["arrival"] <= now:
+                job = waiting.popleft()
+                start_job(job, settings)
+                running.append(job)
+            for job in [j for j in running if j["proc"].poll() is not None]:
+                finish_job(job)
+                running.remove(job)
+            time.sleep(0.05)
+
+    elapsed = time.time() - started
+    busy_after, total_after = cpu_times()
+    children_after = os.times()
+    child_cpu = (children_after.children_user - children_before.children_user) + \
+                (children_after.children_system - children_before.children_system)
+    cpus = os.cpu_count() or 1
+
+    latencies = [j["finished"] - j["arrival"] for j in jobs]
+    run_times = [j["finished"] - j["started"] for j in jobs]
+    waits = [j["started"] - j["arrival"] for j in jobs]
+    completed = [j for j in jobs if j["status"] == "success"]
+    return {
+        "config": {
+            "jobs": args.jobs, "concurrency": args.concurrency, "images": args.images, "imageSize": args.image_size,
+            "platforms": args.platforms, "transition": args.transition, "text": bool(args.text), "fps": args.fps,
+            "secondsPerImage": args.seconds_per_image, "interval": args.interval, "settings": args.settings, "cpus": cpus
+        },
+        "elapsed": round(elapsed, 2),
+        "completed": len(completed),
+        "failed": [{"id": j["id"], "message": j.get("message")} for j in jobs if j["status"] != "success"],
+        "jobsPerHour": round(len(completed) * 3600.0 / elapsed, 1) if elapsed > 0 else 0.0,
+        "videosPerHour": round(sum(j["videos"] for j in completed) * 3600.0 / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+                    "max": round(max(latencies), 2)},
+        "runTime": {"p50": percentile(run_times, 50), "p95": percentile(run_times, 95)},
+        "queueWait": {"p50": percentile(waits, 50), "p95": percentile(waits, 95)},
+        # Whole machine (/proc/stat) and the generators' own CPU time, both as a share of all CPUs
+        "cpu": {
+            "systemUtilisation": round((busy_after - busy_before) / float(max(1, total_after - total_before)), 3),
+            "generatorUtilisation": round(child_cpu / (elapsed * cpus), 3) if elapsed > 0 else 0.0
+        },
+        "memory": {
+            "peakTreeRssMb": round(sampler.peak / 1048576.0, 1),
+            "meanTreeRssMb": round(float(np.mean(sampler.samples)) / 1048576.0, 1) if sampler.samples else 0.0
+        }
+    }
+
+def compare(report, baseline, tolerance):
+    """Regressions of report against baseline beyond tolerance percent."""
+    regressions = []
+    if report["jobsPerHour"] < baseline["jobsPerHour"] * (1 - tolerance / 100.0):
+        regressions.append(f"jobs/hour {report['jobsPerHour']} < baseline {baseline['jobsPerHour']}")
+    if report["latency"]["p95"] > baseline["latency"]["p95"] * (1 + tolerance / 100.0):
+        regressions.append(f"p95 latency {report['latency']['p95']}s > baseline {baseline['latency']['p95']}s")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=8, help="Jobs to run in total")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs running at the same time")
+    parser.add_argument("--images", type=int, default=5, help="Images per job")
+    parser.add_argument("--image-size", default="1600x1200", help="Synthetic image size, WxH")
+    parser.add_argument("--platforms", default="tiktok,instagram", help="Comma-separated platforms per job")
+    parser.add_argument("--transition", default="fade")
+    parser.add_argument("--text", action="store_true", help="Add the text overlay")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--seconds-per-image", type=float, default=3.0)
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds between job arrivals (0: all at once)")
+    parser.add_argument("--settings", help="JSON settings merged over the generated ones")
+    parser.add_argument("--output", help="Write the report to this file as well")
+    parser.add_argument("--baseline", help="Report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Allowed regression in percent")
+    parser.add_argument("--keep", help="Directory to keep the jobs and their outputs in")
+    args = parser.parse_args()
+    if args.jobs < 1 or args.concurrency < 1:
+        parser.error("--jobs and --concurrency must be at least 1")
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="lvids_load_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        report = run(args, work_dir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    passed = not report["failed"]
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        passed = passed and not report["regressions"]
+    report["passed"] = passed
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report))
+    sys.exit(0 if passed else 1)
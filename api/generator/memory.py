@@ -0,0 +1,215 @@
+import os
+from PIL import Image
+
+MB = 1024 * 1024
+
+# Constants below are fitted to `benchmarks.py memory` (peak RSS of a forked
+# format worker and of its ffmpeg children, 1080x1920, preset medium) plus
+# ~15% headroom; rerun it after changing the render or encoding paths.
+# Fixed cost of a format worker: interpreter + numpy/moviepy/PIL imports
+# (a cut render of 1080x1920 stills peaks at ~130 MB in total).
+WORKER_BASE_BYTES = 120 * MB
+# Full-size RGB buffers alive while compositing one output frame
+# (composite canvas, blit copies).
+COMPOSITE_FRAMES = 6
+# Extra full-size RGB frames' worth of temporaries per producer thread while
+# a transition renders: moviepy composites in float64, masked transitions
+# add float masks and displacement maps. Measured over a cut render:
+# glitch/pixelate +22 MB, fade +50 MB, zoom/fly/3d ~+175 MB, slide ~+250 MB,
+# spin ~+275 MB, masked ~+345 MB.
+TRANSITION_FRAMES = {
+    "cut": 0, "glitch": 5, "pixelate": 5, "fade": 10, "blur_crossfade": 10,
+    "zoom_in": 34, "zoom_out": 34, "fly_in": 34, "fly_out": 34, "cube3d": 34, "flip3d": 34,
+    "slide_left": 48, "slide_right": 48, "slide_up": 48, "slide_down": 48,
+    "spin_in": 54, "spin_out": 54
+}
+# Masked transitions (wipe/circle/page_curl/ripple/luma) and anything unknown
+MASKED_TRANSITION_FRAMES = 68
+# Text overlay compositing per producer thread (~110-150 MB measured)
+TEXT_FRAMES = 30
+# One ffmpeg/x264 process per output (main file and every rendition):
+# fixed cost, raw input frames queued at the clip size (rgb24), and x264's
+# lookahead/reference/rate-control frames at the output size in yuv420p,
+# which grow with its frame threads (~545 MB at 1 thread from an rgb24 pipe;
+# x264 alone ~464 MB at 1 thread, ~650 MB at 8, ~840 MB at 16).
+ENCODER_BASE_BYTES = 48 * MB
+ENCODER_INPUT_FRAMES = 16
+ENCODER_FRAMES = 160
+ENCODER_THREAD_FRAMES = 10
+# Frame producer threads per format when neither frameWorkers nor
+# LVIDS_FRAME_WORKERS is set. One renders on the encoding thread: formats
+# already run in parallel processes and x264 uses every core, and threaded
+# compositing measured no gain on top of that (16.7 vs 16.0 fps).
+DEFAULT_FRAME_WORKERS = 1
+# Columns/rows per strip when scaling a panorama (panorama.STRIP_SIZE)
+PANORAMA_STRIP = 256
+
+def probe_image_size(image_path):
+    """Read image dimensions from the file header without decoding pixels."""
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except Exception:
+        return None
+
+def get_memory_budget(settings=None):
+    """
+    Resolve the RSS budget (bytes) shared by all format workers of a job.
+    Order: settings.memoryBudgetMb, LVIDS_MEMORY_BUDGET_MB, then 75% of the
+    container (cgroup) limit or physical memory. Returns None if unknown.
+    """
+    settings = settings or {}
+    for value in (settings.get("memoryBudgetMb"), os.environ.get("LVIDS_MEMORY_BUDGET_MB")):
+        try:
+            if value is not None and float(value) > 0:
+                return int(float(value) * MB)
+        except (TypeError, ValueError):
+            continue
+
+    limits = []
+    for cgroup_file in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(cgroup_file) as f:
+                raw = f.read().strip()
+            if raw.isdigit() and int(raw) < (1 << 60):
+                limits.append(int(raw))
+        except OSError:
+            continue
+    try:
+        limits.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (AttributeError, ValueError, OSError):
+        pass
+    if not limits:
+        return None
+    return int(min(limits) * 0.75)
+
+def get_encoder_threads():
+    """x264 threads per output; generate_format passes this as -threads."""
+    return max(1, os.cpu_count() or 1)
+
+def estimate_encoder_memory(dimensions, out_size=None, threads=None):
+    """Peak RSS (bytes) of one ffmpeg encoder fed dimensions-sized frames, writing out_size."""
+    w, h = dimensions
+    out_w, out_h = out_size or dimensions
+    threads = threads or get_encoder_threads()
+    return (ENCODER_BASE_BYTES + ENCODER_INPUT_FRAMES * w * h * 3
+            + (ENCODER_FRAMES + threads * ENCODER_THREAD_FRAMES) * out_w * out_h * 3 // 2)
+
+def get_frame_workers(settings=None):
+    """
+    Resolve (workers, depth) for the threaded frame producer of one format.
+    workers: settings.frameWorkers, LVIDS_FRAME_WORKERS, else
+    DEFAULT_FRAME_WORKERS. Set either to 2-4 to composite frames in threads
+    on hosts with spare cores (one format at a time, light x264 presets);
+    benchmark with `benchmarks.py producer` first.
+    depth: settings.frameQueueDepth, else twice the workers; 1 worker renders
+    on the encoding thread as before.
+    """
+    settings = settings or {}
+    workers = None
+    for value in (settings.get("frameWorkers"), os.environ.get("LVIDS_FRAME_WORKERS")):
+        try:
+            if value is not None and int(value) > 0:
+                workers = int(value)
+                break
+        except (TypeError, ValueError):
+            continue
+    if workers is None:
+        workers = DEFAULT_FRAME_WORKERS
+    try:
+        depth = int(settings.get("frameQueueDepth") or 0)
+    except (TypeError, ValueError):
+        depth = 0
+    return workers, max(workers, depth or 2 * workers)
+
+def estimate_preprocess_bytes(image_sizes, width, height, tolerance=0.03, strip_panoramas=True):
+    """
+    Peak memory of preprocessing one image: decoded original + scaled cover.
+    With strip_panoramas, panoramas are scaled strip by strip into a file
+    (panorama.py), so only one strip is held next to the decoded original.
+    """
+    peak = 0
+    for size in image_sizes:
+        if not size:
+            size = (width, height)
+        img_w, img_h = size
+        scale = max(width / img_w, height / img_h)
+        scaled_w, scaled_h = int(img_w * scale), int(img_h * scale)
+        if strip_panoramas and abs(img_w / img_h - width / height) > tolerance:
+            scaled = PANORAMA_STRIP * max(scaled_w, scaled_h) * 2
+        else:
+            scaled = scaled_w * scaled_h
+        peak = max(peak, (img_w * img_h + scaled) * 3)
+    return peak
+
+def estimate_format_memory(image_sizes, dimensions, settings, renditions=(), tolerance=0.03):
+    """
+    Estimate the peak RSS (bytes) of one generate_format worker and its
+    encoders. renditions: (w, h) of every extra output (see parse_renditions).
+    Returns (render_bytes, per_preprocess_thread_bytes); the render estimate
+    covers the stills and scaled panoramas the streaming timeline keeps
+    resident (at most two at a time), compositing, transition and text
+    temporaries of every frame producer thread, queued frames and one
+    encoder per output. With fastPaths the panoramas are memory-mapped and
+    only the window on screen is read.
+    """
+    strip_panoramas = settings.get("fastPaths", True)
+    w, h = dimensions
+    frame_bytes = w * h * 3
+    per_image = []
+    for size in image_sizes:
+        if not size:
+            per_image.append(frame_bytes)
+            continue
+        img_w, img_h = size
+        if abs(img_w / img_h - w / h) <= tolerance:
+            per_image.append(frame_bytes)
+        elif strip_panoramas:
+            # Panorama: one window of the mapped file, copied into the frame
+            per_image.append(frame_bytes)
+        else:
+            # Panorama: the scaled original is held in addition to the still
+            scale = max(w / img_w, h / img_h)
+            per_image.append(frame_bytes + int(img_w * scale) * int(img_h * scale) * 3)
+    stills = sum(sorted(per_image, reverse=True)[:2])
+
+    # Each producer thread composites its own frame; finished frames wait in
+    # the queue as a copy plus their converted pipe bytes.
+    workers, depth = get_frame_workers(settings)
+    queued = depth if workers > 1 else 0
+    per_thread = COMPOSITE_FRAMES + TRANSITION_FRAMES.get(settings.get("transition", "cut"), MASKED_TRANSITION_FRAMES)
+    if (settings.get("textOverlay") or {}).get("enabled"):
+        per_thread += TEXT_FRAMES
+    working = (workers * per_thread + queued * 2) * frame_bytes
+    encoders = sum(estimate_encoder_memory(dimensions, size) for size in [None] + list(renditions))
+
+    render_bytes = WORKER_BASE_BYTES + stills + working + encoders
+    return render_bytes, estimate_preprocess_bytes(image_sizes, w, h, tolerance, strip_panoramas)
+
+def plan_concurrency(estimates, budget, max_processes):
+    """
+    Pick the number of parallel format workers and preprocess threads so that
+    the largest estimates running together stay within the budget.
+    estimates: list of (render_bytes, per_preprocess_thread_bytes).
+    Returns (num_processes, preprocess_workers); preprocess_workers is None
+    when there is no budget to enforce.
+    """
+    if not estimates:
+        return 1, None
+    max_processes = max(1, min(max_processes, len(estimates)))
+    if not budget:
+        return max_processes, None
+
+    largest = sorted((r for r, _ in estimates), reverse=True)
+    num_processes = 1
+    for n in range(max_processes, 0, -1):
+        if sum(largest[:n]) <= budget:
+            num_processes = n
+            break
+
+    # Preprocessing happens before the timeline is built, so each worker's
+    # share of the budget beyond its base cost goes to decode threads.
+    share = budget // num_processes - WORKER_BASE_BYTES
+    per_thread = max(p for _, p in estimates) or 1
+    preprocess_workers = max(1, int(share // per_thread))
+    return num_processes, preprocess_workers
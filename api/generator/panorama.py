@@ -0,0 +1,162 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from moviepy.editor import VideoClip, ImageClip
+from cache import file_digest
+
+# Bump when the scaled raster written by prepare_panorama changes
+PANORAMA_VERSION = 1
+# Output columns (horizontal pans) or rows (vertical pans) scaled per strip
+STRIP_SIZE = 256
+
+def panorama_geometry(img_w, img_h, target_w, target_h):
+    """Scaled size of a panorama covering the frame, as make_panorama_clip computes it."""
+    scale = max(target_w / img_w, target_h / img_h)
+    return int(img_w * scale), int(img_h * scale)
+
+class PanoramaSource:
+    """
+    A panorama scaled to cover the frame, stored as raw RGB in a file.
+    Horizontal pans are stored column-major (scaled_w, scaled_h, 3) so the
+    columns of one frame are contiguous; vertical pans row-major.
+    """
+
+    def __init__(self, path, scaled_size, transposed):
+        self.path = path
+        self.scaled_w, self.scaled_h = scaled_size
+        self.transposed = transposed
+
+    @property
+    def shape(self):
+        if self.transposed:
+            return (self.scaled_w, self.scaled_h, 3)
+        return (self.scaled_h, self.scaled_w, 3)
+
+    def open(self):
+        return np.memmap(self.path, dtype=np.uint8, mode="r", shape=self.shape)
+
+def panorama_cache_key(image_path, scaled_size, transposed):
+    scaled_w, scaled_h = scaled_size
+    layout = "cols" if transposed else "rows"
+    return f"{file_digest(image_path)}_{scaled_w}x{scaled_h}_{layout}_v{PANORAMA_VERSION}"
+
+def write_scaled_strips(image_path, dest_path, scaled_size, transposed):
+    """
+    Scale the image to scaled_size strip by strip, straight into dest_path.
+    JPEGs are decoded with DCT scaling to the smallest size that is still at
+    least scaled_size, so a 30000x4000 original destined for a 1920 px high
+    frame is decoded at half size; the scaled image is never held in memory.
+    """
+    scaled_w, scaled_h = scaled_size
+    with Image.open(image_path) as img:
+        img.draft("RGB", (scaled_w, scaled_h))
+        img = img.convert("RGB")
+        sx = img.width / scaled_w
+        sy = img.height / scaled_h
+        with open(dest_path, "wb") as out:
+            if transposed:
+                for c0 in range(0, scaled_w, STRIP_SIZE):
+                    c1 = min(scaled_w, c0 + STRIP_SIZE)
+                    strip = img.resize((c1 - c0, scaled_h), Image.Resampling.LANCZOS,
+                                       box=(c0 * sx, 0, c1 * sx, img.height))
+                    out.write(np.ascontiguousarray(np.asarray(strip).transpose(1, 0, 2)).tobytes())
+            else:
+                for r0 in range(0, scaled_h, STRIP_SIZE):
+                    r1 = min(scaled_h, r0 + STRIP_SIZE)
+                    strip = img.resize((scaled_w, r1 - r0), Image.Resampling.LANCZOS,
+                                       box=(0, r0 * sy, img.width, r1 * sy))
+                    out.write(strip.tobytes())
+
+def prepare_panorama(image_path, output_dir, target_w, target_h, cache=None):
+    """
+    Scale a panorama for a target frame into a raw file in output_dir, via
+    the DiskCache when given. Returns a PanoramaSource.
+    """
+    with Image.open(image_path) as img:
+        img_w, img_h = img.size
+    scaled_size = panorama_geometry(img_w, img_h, target_w, target_h)
+    transposed = scaled_size[0] - target_w > 0
+    base = os.path.splitext(os.path.basename(image_path))[0]
+    output_path = os.path.join(output_dir, f"panorama_{base}_{scaled_size[0]}x{scaled_size[1]}.rgb")
+
+    if cache is None:
+        write_scaled_strips(image_path, output_path, scaled_size, transposed)
+        return PanoramaSource(output_path, scaled_size, transposed)
+
+    key = panorama_cache_key(image_path, scaled_size, transposed)
+    if not cache.get(key, ".rgb"):
+        temp_path = cache.temp_path(key, ".rgb")
+        try:
+            write_scaled_strips(image_path, temp_path, scaled_size, transposed)
+            cache.commit(temp_path, key, ".rgb")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return PanoramaSource(cache.export(key, ".rgb", output_path), scaled_size, transposed)
+
+def prepare_panoramas(image_paths, output_dir, width, height, max_workers=None, cache=None):
+    """prepare_panorama for several images in a thread pool, like preprocess_images."""
+    if not image_paths:
+        return []
+    cpu_workers = min(len(image_paths), max(1, os.cpu_count() or 1))
+    max_workers = cpu_workers if not max_workers else max(1, min(cpu_workers, max_workers))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(prepare_panorama, p, output_dir, width, height, cache) for p in image_paths]
+        results = [future.result() for future in futures]
+    if cache is not None:
+        cache.evict()
+    return results
+
+class PanoramaClip(VideoClip):
+    """
+    Pan across a PanoramaSource, reading only the window on screen from the
+    memory-mapped file. Frames match make_panorama_clip: the image moves
+    linearly from its first to its last edge over duration, positions are
+    truncated like moviepy's blit, and uncovered pixels stay black.
+    """
+
+    def __init__(self, source, duration, target_w, target_h):
+        self.source = source
+        self.target_w = target_w
+        self.target_h = target_h
+        self._pixels = source.open()
+        pan_x = max(0, source.scaled_w - target_w)
+        pan_y = max(0, source.scaled_h - target_h)
+        denom = duration if duration > 0 else 0.01
+        if pan_x > 0:
+            y = (target_h - source.scaled_h) // 2
+            self._position = lambda t: (int(-pan_x * (t / denom)), int(y))
+        else:
+            x = (target_w - source.scaled_w) // 2
+            self._position = lambda t: (int(x), int(-pan_y * (t / denom)))
+        VideoClip.__init__(self, self._frame, duration=duration)
+
+        # Pixels the image never reaches (size rounding) are transparent, as in the composite
+        covered = np.zeros((target_h, target_w), dtype=float)
+        frame_rows, frame_cols, _, _ = self._blit_area(*self._position(0))
+        covered[frame_rows, frame_cols] = 1.0
+        if not covered.all():
+            self.mask = ImageClip(covered, ismask=True).set_duration(duration)
+
+    def _blit_area(self, xp, yp):
+        """(frame rows, frame cols, image rows, image cols) for the image placed at (xp, yp)."""
+        w, h = self.source.scaled_w, self.source.scaled_h
+        xp1, yp1 = max(0, xp), max(0, yp)
+        xp2, yp2 = min(self.target_w, xp + w), min(self.target_h, yp + h)
+        x1, y1 = max(0, -xp), max(0, -yp)
+        return (slice(yp1, yp2), slice(xp1, xp2),
+                slice(y1, y1 + max(0, yp2 - yp1)), slice(x1, x1 + max(0, xp2 - xp1)))
+
+    def _frame(self, t):
+        frame_rows, frame_cols, rows, cols = self._blit_area(*self._position(t))
+        frame = np.zeros((self.target_h, self.target_w, 3), dtype=np.uint8)
+        if self.source.transposed:
+            frame[frame_rows, frame_cols] = self._pixels[cols, rows].transpose(1, 0, 2)
+        else:
+            frame[frame_rows, frame_cols] = self._pixels[rows, cols]
+        return frame
+
+    def close(self):
+        self._pixels = None
+        VideoClip.close(self)
@@ -1,19 +1,34 @@
 import os
 from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from cache import file_digest
 
-def preprocess_image(image_path, output_dir, target_width, target_height):
+# Bump when the output of preprocess_image changes so cached stills are not reused
+PREPROCESS_VERSION = 1
+
+def preprocess_cache_key(image_path, target_width, target_height):
+    return f"{file_digest(image_path)}_{target_width}x{target_height}_v{PREPROCESS_VERSION}"
+
+def preprocess_image(image_path, output_dir, target_width, target_height, cache=None):
     """
     Preprocess a single image:
     - No cropping allowed (contain mode).
     - Background: same image, cover mode.
     - Upscale maximum 2x only.
     - Save to output_dir.
+    With a DiskCache, results are looked up and stored by source content
+    hash + target size, and linked into output_dir.
     """
     try:
         filename = os.path.basename(image_path)
         output_path = os.path.join(output_dir, f"processed_{filename}")
 
+        if cache is not None:
+            key = preprocess_cache_key(image_path, target_width, target_height)
+            ext = os.path.splitext(filename)[1].lower() or ".jpg"
+            if cache.get(key, ext):
+                return cache.export(key, ext, output_path)
+
         img = Image.open(image_path).convert("RGB")
         img_w, img_h = img.size
         target_ratio = target_width / target_height
@@ -28,6 +43,16 @@ def preprocess_image(image_path, output_dir, target_width, target_height):
         top = max(0, (bg_h - target_height) // 2)
         bg = bg.crop((left, top, left + target_width, top + target_height))
 
+        if cache is not None:
+            temp_path = cache.temp_path(key, ext)
+            try:
+                bg.save(temp_path, format=Image.registered_extensions().get(ext), quality=95)
+                cache.commit(temp_path, key, ext)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            return cache.export(key, ext, output_path)
+
         bg.save(output_path, quality=95)
         return output_path
 
@@ -35,10 +60,14 @@ def preprocess_image(image_path, output_dir, target_width, target_height):
         print(f"Error processing {image_path}: {str(e)}")
         raise
 
-def preprocess_images(image_paths, temp_dir, width, height):
+def preprocess_images(image_paths, temp_dir, width, height, max_workers=None, cache=None):
     if not image_paths:
         return []
-    max_workers = min(len(image_paths), max(1, os.cpu_count() or 1))
+    cpu_workers = min(len(image_paths), max(1, os.cpu_count() or 1))
+    max_workers = cpu_workers if not max_workers else max(1, min(cpu_workers, max_workers))
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(preprocess_image, p, temp_dir, width, height) for p in image_paths]
-        return [future.result() for future in futures]
+        futures = [executor.submit(preprocess_image, p, temp_dir, width, height, cache) for p in image_paths]
+        results = [future.result() for future in futures]
+    if cache is not None:
+        cache.evict()
+    return results
@@ -0,0 +1,69 @@
+"""
+Priorities and ordering for format tasks from several jobs.
+
+Every job has a priority class from settings.priority: "interactive" (a
+user waiting on a quick check or preview) is served before "batch" (final
+renders, bulk runs). Within a class, jobs share the workers fairly: the
+next task comes from the job with the fewest tasks running, then the
+oldest. Used by the spool's claim() and by batch mode's task order.
+A single-job render can also be paused from outside through a YieldFile.
+"""
+import os
+import time
+from collections import defaultdict
+
+PRIORITIES = {"interactive": 0, "preview": 0, "batch": 1, "final": 1}
+DEFAULT_PRIORITY = "batch"
+
+def priority_level(settings=None):
+    """Numeric level of settings.priority; lower is more urgent."""
+    settings = settings or {}
+    name = str(settings.get("priority") or DEFAULT_PRIORITY).lower()
+    return PRIORITIES.get(name, PRIORITIES[DEFAULT_PRIORITY])
+
+def pick_next(candidates, running):
+    """
+    candidates: (level, job, queued_at, item) for every waiting task.
+    running: {job: tasks running}. Returns the candidates in the order they
+    should be tried: level, then fewest running tasks of the same job, then
+    the oldest.
+    """
+    return sorted(candidates, key=lambda c: (c[0], running.get(c[1], 0), c[2]))
+
+def fair_order(tasks):
+    """
+    Order (level, job, item) tuples for a pool that takes them in sequence:
+    by level, then round-robin over jobs so one job's formats don't hold
+    every slot while another job waits. Returns the items.
+    """
+    by_level = defaultdict(lambda: defaultdict(list))
+    for level, job, item in tasks:
+        by_level[level][job].append(item)
+    ordered = []
+    for level in sorted(by_level):
+        queues = list(by_level[level].values())
+        while queues:
+            for queue in queues:
+                ordered.append(queue.pop(0))
+            queues = [q for q in queues if q]
+    return ordered
+
+class YieldFile:
+    """
+    generate_format checkpoint for single-job renders: while the file exists,
+    the render waits at its next segment boundary. The API server creates it
+    to let a more urgent job run and removes it when that job is done.
+    Picklable, so it can be passed to the format pool.
+    """
+    def __init__(self, path, poll_interval=0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+
+    def __call__(self):
+        if not os.path.exists(self.path):
+            return
+        paused = time.time()
+        print(f"Pausing at {self.path}")
+        while os.path.exists(self.path):
+            time.sleep(self.poll_interval)
+        print(f"Resuming after {time.time() - paused:.1f}s")
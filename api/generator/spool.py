@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import uuid
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from scheduler import priority_level, pick_next
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+TASK_EXT = ".task"
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file next to path and rename it into place, readable by every user."""
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        # mkstemp creates 0600; workers and the server may run as other users
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def read_json(path, default=None):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def wait_summary(results):
+    """Queue wait and preemption stats over task results."""
+    waits = [r.get("waited", 0.0) for r in results]
+    if not waits:
+        return {"tasks": 0, "max": 0.0, "mean": 0.0, "preempted": 0.0}
+    return {
+        "tasks": len(waits),
+        "max": round(max(waits), 3),
+        "mean": round(sum(waits) / len(waits), 3),
+        # Seconds tasks spent paused while a more urgent task ran in their worker
+        "preempted": round(sum(r.get("preempted", 0.0) for r in results), 3)
+    }
+
+class Claim:
+    def __init__(self, job_id, index, attempt, path, level=0, waited=0.0):
+        self.job_id = job_id
+        self.index = index
+        self.attempt = attempt
+        self.path = path
+        # Priority level (see scheduler.py) and seconds the task sat in pending/
+        self.level = level
+        self.waited = waited
+
+class Spool:
+    """
+    Job queue kept in a directory on shared storage, no broker needed.
+
+        jobs/<job>/job.json          submitted job (images, id, output, settings)
+        jobs/<job>/results/<n>.json  outcome of task n, written by its worker
+        jobs/<job>/status.json       final job status, once every task reported
+        pending/<level>.<job>.<n>.<attempt>.task
+        running/<level>.<job>.<n>.<attempt>.task
+
+    Workers claim a task by renaming it from pending/ to running/; rename is
+    atomic, so exactly one worker wins. Tasks are tried by priority level,
+    then fair share between jobs, then age (scheduler.pick_next). A pending
+    file's mtime is when it was queued; a claimed file's mtime is the
+    worker's heartbeat. Tasks whose heartbeat is older than the lease are put
+    back into pending/ with the attempt bumped, up to max_attempts.
+    """
+
+    def __init__(self, root, lease=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.root = root
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.pending_dir = os.path.join(root, "pending")
+        self.running_dir = os.path.join(root, "running")
+        self.jobs_dir = os.path.join(root, "jobs")
+        for path in (self.pending_dir, self.running_dir, self.jobs_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def submit(self, job, task_names, job_id=None):
+        """
+        Queue a job split into len(task_names) tasks. job must be JSON
+        serialisable; it is stored as job.json with the task names. The
+        priority level comes from job["settings"]["priority"].
+        Returns the spool job id.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        level = priority_level(job.get("settings"))
+        os.makedirs(os.path.join(job_dir, "results"), exist_ok=True)
+        write_json_atomic(os.path.join(job_dir, "job.json"),
+                          dict(job, tasks=list(task_names), level=level, submitted=time.time()))
+        if not task_names:
+            self._finish(job_id)
+        for index in range(len(task_names)):
+            task_path = os.path.join(self.pending_dir, f"{level}.{job_id}.{index}.1{TASK_EXT}")
+            write_json_atomic(task_path, {"job": job_id, "index": index})
+        return job_id
+
+    def load_job(self, job_id):
+        return read_json(os.path.join(self.job_dir(job_id), "job.json"))
+
+    def _parse(self, name):
+        level, rest = name[:-len(TASK_EXT)].split(".", 1)
+        job_id, index, attempt = rest.rsplit(".", 2)
+        return int(level), job_id, int(index), int(attempt)
+
+    def _tasks(self, directory):
+        """(level, job_id, index, attempt, name) for every task file in directory."""
+        try:
+            names = [n for n in os.listdir(directory) if n.endswith(TASK_EXT)]
+        except OSError:
+            return []
+        tasks = []
+        for name in names:
+            try:
+                tasks.append(self._parse(name) + (name,))
+            except ValueError:
+                continue
+        return tasks
+
+    def claim(self, max_level=None):
+        """
+        Claim the next pending task (see scheduler.pick_next), or return None
+        if there is none. max_level only considers tasks at least that urgent.
+        """
+        running = {}
+        for _, job_id, _, _, _ in self._tasks(self.running_dir):
+            running[job_id] = running.get(job_id, 0) + 1
+        candidates = []
+        for level, job_id, _, _, name in self._tasks(self.pending_dir):
+            if max_level is not None and level > max_level:
+                continue
+            try:
+                queued = os.stat(os.path.join(self.pending_dir, name)).st_mtime
+            except OSError:
+                continue
+            candidates.append((level, job_id, queued, name))
+        for level, _, queued, name in pick_next(candidates, running):
+            source = os.path.join(self.pending_dir, name)
+            target = os.path.join(self.running_dir, name)
+            try:
+                # Heartbeat first: a task that waited longer than the lease must not
+                # look stale to requeue_stale the moment it lands in running/
+                os.utime(source, None)
+                os.rename(source, target)
+            except OSError:
+                # Another worker claimed it first
+                continue
+            _, job_id, index, attempt = self._parse(name)
+            if os.path.exists(os.path.join(self.job_dir(job_id), "results", f"{index}.json")):
+                # A worker whose lease had expired finished it after all
+                os.remove(target)
+                continue
+            return Claim(job_id, index, attempt, target, level, max(0.0, time.time() - queued))
+        return None
+
+    @contextmanager
+    def heartbeat(self, claim, interval=None):
+        """Keep the claim's lease alive while the body runs."""
+        interval = interval or max(1.0, self.lease / 4.0)
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    os.utime(claim.path, None)
+                except OSError:
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, claim, result):
+        """
+        Record a task's result ({"output", "files"} or {"error"}) and release
+        the claim; writes status.json when the job is finished.
+        """
+        result = dict(result, index=claim.index, attempt=claim.attempt, worker=worker_name(), finished=time.time(),
+                      waited=round(claim.waited, 3))
+        write_json_atomic(os.path.join(self.job_dir(claim.job_id), "results", f"{claim.index}.json"), result)
+        try:
+            os.remove(claim.path)
+        except OSError:
+            pass
+        self._finish(claim.job_id)
+
+    def requeue_stale(self):
+        """Return tasks with an expired lease to pending/, or fail them after max_attempts."""
+        now = time.time()
+        for level, job_id, index, attempt, name in self._tasks(self.running_dir):
+            path = os.path.join(self.running_dir, name)
+            try:
+                if now - os.stat(path).st_mtime <= self.lease:
+                    continue
+            except OSError:
+                continue
+            if attempt >= self.max_attempts:
+                claim = Claim(job_id, index, attempt, path, level)
+                self.complete(claim, {"error": f"Task abandoned after {attempt} attempt(s)"})
+                continue
+            target = os.path.join(self.pending_dir, f"{level}.{job_id}.{index}.{attempt + 1}{TASK_EXT}")
+            try:
+                os.rename(path, target)
+                # Queued again from now, for ordering and wait times
+                os.utime(target, None)
+            except OSError:
+                continue
+
+    def results(self, job_id):
+        results_dir = os.path.join(self.job_dir(job_id), "results")
+        results = {}
+        try:
+            names = os.listdir(results_dir)
+        except OSError:
+            return results
+        for name in names:
+            if name.endswith(".json") and not name.startswith("."):
+                result = read_json(os.path.join(results_dir, name))
+                if result is not None:
+                    results[result["index"]] = result
+        return results
+
+    def _finish(self, job_id):
+        # Every worker that sees all results writes the same status, so races are harmless
+        job = self.load_job(job_id) or {}
+        total = len(job.get("tasks", []))
+        results = self.results(job_id)
+        if len(results) < total:
+            return
+        errors = {job["tasks"][i]: r["error"] for i, r in sorted(results.items()) if r.get("error")}
+        outputs = [r["output"] for _, r in sorted(results.items()) if r.get("output")]
+        status = {
+            "status": "error" if errors or not outputs else "success",
+            "id": job.get("id"),
+            "files": [f for _, r in sorted(results.items()) for f in r.get("files", [])],
+            "outputs": outputs,
+            "wait": wait_summary(results.values()),
+            "finished": time.time()
+        }
+        if errors or not outputs:
+            status["message"] = "; ".join(f"{name}: {err}" for name, err in errors.items()) or "No formats selected by any platform!"
+        write_json_atomic(os.path.join(self.job_dir(job_id), "status.json"), status)
+
+    def status(self, job_id):
+        """Final status if written, else progress derived from the spool files."""
+        final = read_json(os.path.join(self.job_dir(job_id), "status.json"))
+        if final is not None:
+            return final
+        job = self.load_job(job_id)
+        if job is None:
+            return {"status": "unknown", "job": job_id}
+        running = any(t[1] == job_id for t in self._tasks(self.running_dir))
+        now = time.time()
+        waiting = 0.0
+        for _, task_job, _, _, name in self._tasks(self.pending_dir):
+            if task_job == job_id:
+                try:
+                    waiting = max(waiting, now - os.stat(os.path.join(self.pending_dir, name)).st_mtime)
+                except OSError:
+                    continue
+        results = self.results(job_id)
+        return {
+            "status": "running" if running else "queued",
+            "id": job.get("id"),
+            "completed": len(results),
+            "total": len(job.get("tasks", [])),
+            "wait": wait_summary(results.values()),
+            # How long the job's oldest pending task has been waiting
+            "waiting": round(waiting, 3)
+        }
@@ -0,0 +1,139 @@
+"""
+Multi-worker spool check: queues synthetic jobs in a temporary spool,
+starts several `generator.py --spool DIR --worker --once` processes at the
+same time, and checks that every task was claimed and finished exactly
+once and that every job reports success with all of its files on disk.
+
+    python spooltest.py [--workers 2] [--jobs 3] [--platforms tiktok,youtube] [--images 2]
+                        [--fps 10] [--seconds-per-image 1.5] [--keep DIR]
+
+Prints a JSON report and exits with status 1 if any check fails.
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess as sp
+from collections import Counter
+from PIL import Image
+from benchmarks import synthetic_still
+from spool import Spool
+
+GENERATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generator.py")
+CLAIM_LINE = re.compile(r"Worker claimed (\w+) task (\d+) \(attempt (\d+)")
+
+def submit_jobs(args, spool_dir, work_dir):
+    """Queue args.jobs jobs through the CLI; returns their spool job ids."""
+    settings = {
+        "fps": args.fps,
+        "secondsPerImage": args.seconds_per_image,
+        "transition": "fade",
+        "platforms": {p: True for p in args.platforms.split(",") if p},
+        "cacheDir": os.path.join(work_dir, "cache")
+    }
+    job_ids = []
+    for index in range(args.jobs):
+        job_dir = os.path.join(work_dir, f"job_{index}")
+        os.makedirs(job_dir)
+        images = []
+        for n in range(args.images):
+            path = os.path.join(job_dir, f"image_{n}.jpg")
+            Image.fromarray(synthetic_still(800, 600, index * 100 + n)).save(path, quality=92)
+            images.append(path)
+        out = sp.run([sys.executable, GENERATOR, "--spool", spool_dir, "--images", *images, "--id", f"spool{index}",
+                      "--output", os.path.join(job_dir, "out"), "--settings", json.dumps(settings)],
+                     capture_output=True, check=True)
+        result = json.loads(out.stdout.decode("utf8").strip().splitlines()[-1])
+        if result.get("status") != "queued":
+            raise RuntimeError(f"Submitting job {index} failed: {result}")
+        job_ids.append(result["job"])
+    return job_ids
+
+def run_workers(count, spool_dir, work_dir):
+    """Start count workers at once and wait for them; returns each worker's (exit code, log text)."""
+    procs = []
+    for index in range(count):
+        log_path = os.path.join(work_dir, f"worker_{index}.log")
+        log = open(log_path, "wb")
+        proc = sp.Popen([sys.executable, GENERATOR, "--spool", spool_dir, "--worker", "--once", "--poll", "0.2"],
+                        stdout=sp.DEVNULL, stderr=log)
+        procs.append((proc, log, log_path))
+    workers = []
+    for proc, log, log_path in procs:
+        proc.wait()
+        log.close()
+        with open(log_path, encoding="utf8", errors="replace") as f:
+            workers.append((proc.returncode, f.read()))
+    return workers
+
+def check(spool, job_ids, workers):
+    """Failures found in the spool after the workers exited, plus per-worker claim counts."""
+    failures = []
+    claims = Counter()
+    per_worker = []
+    for _, log in workers:
+        found = [(job, int(index)) for job, index, _ in CLAIM_LINE.findall(log)]
+        claims.update(found)
+        per_worker.append(len(found))
+    for code in (code for code, _ in workers if code != 0):
+        failures.append(f"a worker exited with status {code}")
+
+    for job_id in job_ids:
+        job = spool.load_job(job_id)
+        status = spool.status(job_id)
+        if status.get("status") != "success":
+            failures.append(f"{job_id}: status {status.get('status')} {status.get('message', '')}".strip())
+        for index in range(len(job["tasks"])):
+            if claims[(job_id, index)] != 1:
+                failures.append(f"{job_id} task {index} was claimed {claims[(job_id, index)]} time(s)")
+        results = spool.results(job_id)
+        if sorted(results) != list(range(len(job["tasks"]))):
+            failures.append(f"{job_id}: results for tasks {sorted(results)} of {len(job['tasks'])}")
+        if any(r.get("attempt") != 1 for r in results.values()):
+            failures.append(f"{job_id}: a task needed more than one attempt")
+        for name in status.get("files", []):
+            if not os.path.exists(os.path.join(job["output"], name)):
+                failures.append(f"{job_id}: {name} is missing")
+
+    for directory in (spool.pending_dir, spool.running_dir):
+        left = [n for n in os.listdir(directory) if not n.startswith(".")]
+        if left:
+            failures.append(f"{len(left)} task file(s) left in {os.path.basename(directory)}/")
+    return failures, per_worker
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes started at the same time")
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--platforms", default="tiktok,youtube", help="Comma-separated platforms, one task each")
+    parser.add_argument("--images", type=int, default=2, help="Images per job")
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--seconds-per-image", type=float, default=1.5)
+    parser.add_argument("--keep", help="Directory to keep the spool, logs and outputs in")
+    args = parser.parse_args()
+    if args.workers < 1 or args.jobs < 1:
+        parser.error("--workers and --jobs must be at least 1")
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="lvids_spooltest_")
+    os.makedirs(work_dir, exist_ok=True)
+    spool_dir = os.path.join(work_dir, "spool")
+    try:
+        job_ids = submit_jobs(args, spool_dir, work_dir)
+        workers = run_workers(args.workers, spool_dir, work_dir)
+        failures, per_worker = check(Spool(spool_dir), job_ids, workers)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "workers": args.workers,
+        "jobs": len(job_ids),
+        "tasksPerWorker": per_worker,
+        "failures": failures,
+        "passed": not failures
+    }
+    print(json.dumps(report))
+    sys.exit(0 if report["passed"] else 1)
@@ -0,0 +1,65 @@
+import os
+import numpy as np
+from PIL import Image
+
+POSTER_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP"}
+
+def thumbnail_names(base_name):
+    """Every poster and sprite file name FrameTap.save can write for base_name."""
+    return [f"{base_name}_{kind}.{ext}" for kind in ("poster", "sprite") for ext in POSTER_FORMATS]
+
+class FrameTap:
+    """
+    Collects a poster frame and thumbnail tiles from the frames the encoder
+    is already rendering, so no second decode of the finished video is needed.
+    Register as an observer of encoder.write_outputs: tap(frame, t).
+    """
+
+    def __init__(self, fps, duration, poster_time=0.0, interval=2.0, thumb_width=160):
+        self.fps = fps
+        last_index = max(0, int(round(duration * fps)) - 1)
+        self.poster_index = min(last_index, max(0, int(round(poster_time * fps))))
+        step = max(1, int(round(interval * fps)))
+        self.thumb_indices = set(range(0, last_index + 1, step))
+        self.thumb_width = thumb_width
+        self.poster = None
+        self.thumbs = {}
+
+    def __call__(self, frame, t):
+        index = int(round(t * self.fps))
+        if index == self.poster_index and self.poster is None:
+            self.poster = Image.fromarray(np.array(frame[:, :, :3], dtype=np.uint8))
+        if index in self.thumb_indices and index not in self.thumbs:
+            img = Image.fromarray(np.array(frame[:, :, :3], dtype=np.uint8))
+            thumb_h = max(1, round(img.height * self.thumb_width / img.width))
+            self.thumbs[index] = img.resize((self.thumb_width, thumb_h), Image.Resampling.LANCZOS)
+
+    def save(self, output_dir, base_name, image_format="jpg", columns=10):
+        """Write the poster and a sprite sheet; returns their description for the result JSON."""
+        ext = image_format.lower() if image_format.lower() in POSTER_FORMATS else "jpg"
+        pil_format = POSTER_FORMATS[ext]
+        assets = {}
+
+        if self.poster is not None:
+            poster_name = f"{base_name}_poster.{ext}"
+            self.poster.save(os.path.join(output_dir, poster_name), format=pil_format, quality=90)
+            assets["poster"] = {"file": poster_name, "time": round(self.poster_index / self.fps, 3)}
+
+        if self.thumbs:
+            indices = sorted(self.thumbs)
+            tile_w, tile_h = self.thumbs[indices[0]].size
+            cols = max(1, min(columns, len(indices)))
+            rows = (len(indices) + cols - 1) // cols
+            sheet = Image.new("RGB", (cols * tile_w, rows * tile_h))
+            for n, index in enumerate(indices):
+                sheet.paste(self.thumbs[index], ((n % cols) * tile_w, (n // cols) * tile_h))
+            sprite_name = f"{base_name}_sprite.{ext}"
+            sheet.save(os.path.join(output_dir, sprite_name), format=pil_format, quality=85)
+            assets["sprite"] = {
+                "file": sprite_name,
+                "tileWidth": tile_w,
+                "tileHeight": tile_h,
+                "columns": cols,
+                "times": [round(i / self.fps, 3) for i in indices]
+            }
+        return assets
@@ -0,0 +1,190 @@
+import threading
+from bisect import bisect_right
+import numpy as np
+from moviepy.editor import VideoClip, ImageClip
+
+class Segment:
+    def __init__(self, start, duration, indices, offset=0.0):
+        self.start = start
+        self.duration = duration
+        self.end = start + duration
+        # One index: body of that image. Two indices: transition between them.
+        self.indices = indices
+        # Time inside the source clip at which a body segment starts
+        self.offset = offset
+
+    @property
+    def is_transition(self):
+        return len(self.indices) == 2
+
+class StreamingTimeline:
+    """
+    Slideshow timeline that builds image clips on demand.
+
+    Produces the same sequence as concatenating every body and transition
+    clip up front, but only the clips of the segments being rendered are
+    resident: the newest segment requested and the one before it (at most
+    two stills). Older clips are released as playback moves on, so memory stays
+    constant regardless of the number of images. make_frame may be called
+    from several threads for nearby timestamps; segment clips are built
+    under a lock and rebuilt if a thread asks for one already released. A
+    source is only closed once no thread is rendering a frame from it.
+
+    load_clip(index) must return a clip of clip_duration for image `index`.
+    make_transition(c1, c2, trans_duration) must return the transition clip.
+    """
+
+    def __init__(self, count, load_clip, duration, trans_duration=0.0, make_transition=None):
+        self.load_clip = load_clip
+        self.make_transition = make_transition
+        self.trans_duration = trans_duration
+        self.segments = []
+
+        # Segment lengths are computed like the equivalent subclip() calls
+        # so that frame timestamps match the concatenated timeline exactly.
+        # Some transitions collapse to a different length than requested
+        # (e.g. padded concatenation); probe the real length on small clips.
+        # The probe must be uint8 and large enough for PIL-based rotate/resize.
+        trans_length = 0.0
+        if make_transition is not None:
+            probe = ImageClip(np.zeros((128, 128, 3), dtype=np.uint8), duration=duration + 2 * trans_duration)
+            trans_length = make_transition(
+                probe.subclip(duration, duration + trans_duration), probe.subclip(0, trans_duration), trans_duration
+            ).duration
+
+        start = 0.0
+        for i in range(count):
+            if make_transition is None:
+                self.segments.append(Segment(start, duration, (i,)))
+                start += duration
+                continue
+            if i > 0:
+                trans = Segment(start, trans_length, (i - 1, i), duration)
+                self.segments.append(trans)
+                start += trans.duration
+            offset = 0.0 if i == 0 else trans_duration
+            body = Segment(start, (offset + duration) - offset, (i,), offset)
+            self.segments.append(body)
+            start += body.duration
+
+        self.duration = start
+        self._starts = [s.start for s in self.segments]
+        self._sources = {}
+        self._segment_clips = {}
+        # Segment index -> frames being rendered from it right now
+        self._rendering = {}
+        self._newest = 0
+        self._lock = threading.Lock()
+
+    @property
+    def slide_starts(self):
+        """Start time of every slide body (the moment each image is fully on screen)."""
+        return [s.start for s in self.segments if not s.is_transition]
+
+    def _source(self, index):
+        clip = self._sources.get(index)
+        if clip is None:
+            clip = self.load_clip(index)
+            self._sources[index] = clip
+        return clip
+
+    def _segment_index(self, t):
+        return max(0, min(bisect_right(self._starts, t) - 1, len(self.segments) - 1))
+
+    def _acquire_segment(self, seg_index):
+        """
+        Segment clip for seg_index, counted as rendering until
+        _release_segment(seg_index) so its sources stay open meanwhile.
+        """
+        with self._lock:
+            clip = self._segment_clips.get(seg_index)
+            if clip is None:
+                clip = self._build_segment(seg_index)
+            self._rendering[seg_index] = self._rendering.get(seg_index, 0) + 1
+            return clip
+
+    def _release_segment(self, seg_index):
+        with self._lock:
+            self._rendering[seg_index] -= 1
+            if not self._rendering[seg_index]:
+                del self._rendering[seg_index]
+
+    def _build_segment(self, seg_index):
+        """Build and keep the clip of seg_index, releasing older ones. Called with the lock held."""
+        # Keep the newest segment requested and the one before it; a late
+        # request for an older segment must not evict the newer ones.
+        self._newest = max(self._newest, seg_index)
+        for index in list(self._segment_clips):
+            if index < self._newest - 1:
+                del self._segment_clips[index]
+        # Segments other threads are still rendering from keep their sources
+        used = {seg_index} | set(self._segment_clips) | set(self._rendering)
+        needed = set()
+        for index in used:
+            needed.update(self.segments[index].indices)
+        for index in list(self._sources):
+            if index not in needed:
+                self._sources.pop(index).close()
+
+        segment = self.segments[seg_index]
+        if segment.is_transition:
+            prev_index, index = segment.indices
+            d = self.trans_duration
+            c1 = self._source(prev_index).subclip(segment.offset, segment.offset + d)
+            c2 = self._source(index).subclip(0, d)
+            clip = self.make_transition(c1, c2, d)
+        else:
+            clip = self._source(segment.indices[0])
+        self._segment_clips[seg_index] = clip
+        return clip
+
+    def make_frame(self, t):
+        seg_index = self._segment_index(t)
+        clip = self._acquire_segment(seg_index)
+        try:
+            segment = self.segments[seg_index]
+            local_t = t - segment.start
+            if not segment.is_transition:
+                local_t += segment.offset
+            return clip.get_frame(local_t)
+        finally:
+            self._release_segment(seg_index)
+
+    def static_key(self, t):
+        """
+        Segment index when the frame at t is a still that does not change
+        within its segment, else None. Only answers for segments that are
+        already built, so the first frame of each segment is always rendered.
+        """
+        seg_index = self._segment_index(t)
+        if self.segments[seg_index].is_transition:
+            return None
+        clip = self._segment_clips.get(seg_index)
+        return seg_index if isinstance(clip, ImageClip) else None
+
+    def boundary_observer(self, callback):
+        """
+        write_outputs observer that calls callback() when the first frame of
+        each new segment comes out of the producer, before it is encoded.
+        Blocking in callback pauses the render between two segments; only
+        the frames already queued stay in memory.
+        """
+        state = {"segment": 0}
+
+        def observe(frame, t):
+            seg_index = self._segment_index(t)
+            if seg_index != state["segment"]:
+                state["segment"] = seg_index
+                callback()
+        return observe
+
+    def to_clip(self):
+        return VideoClip(self.make_frame, duration=self.duration)
+
+    def close(self):
+        with self._lock:
+            for clip in self._sources.values():
+                clip.close()
+            self._sources.clear()
+            self._segment_clips.clear()
+            self._newest = 0
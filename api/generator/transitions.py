@@ -1,3 +1,4 @@
+import threading
 import numpy as np
 from moviepy.editor import CompositeVideoClip, VideoClip, ImageClip
 from PIL import Image
@@ -199,3 +200,69 @@ def ripple_transition(clip1, clip2, duration=1.0):
     mask_clip = VideoClip(make_mask, duration=duration, ismask=True)
     c2_masked = c2.set_mask(mask_clip)
     return CompositeVideoClip([c1, c2_masked], size=(w,h))
+
+def crossfade_transition(clip1, clip2, duration=1.0, fps=None):
+    """
+    Linear blend from clip1 to clip2 using integer arithmetic.
+    Frames are mixed as (a * (256 - w) + b * w) >> 8 in uint16 scratch buffers
+    that are reused for every frame (one set per thread); w comes from a
+    per-frame schedule when fps is known. Still frames are widened to uint16
+    only once. The returned frame is only valid until the same thread
+    renders the next one.
+    """
+    w, h = clip1.size
+    c1 = clip1.set_duration(duration)
+    c2 = clip2.set_duration(duration)
+
+    schedule = None
+    if fps:
+        frame_times = np.arange(int(np.ceil(duration * fps)) + 1) / fps
+        schedule = np.clip(np.round(256 * frame_times / duration), 0, 256).astype(np.uint16)
+
+    def weight(t):
+        if schedule is not None:
+            index = int(round(t * fps))
+            if index < len(schedule) and abs(index - t * fps) < 1e-6:
+                return int(schedule[index])
+        return int(min(256, max(0, round(256 * t / duration))))
+
+    # Per-thread buffers so frames can be produced concurrently
+    local = threading.local()
+
+    def buffers():
+        if not hasattr(local, "out"):
+            local.scratch = np.empty((h, w, 3), dtype=np.uint16)
+            local.scratch_b = np.empty((h, w, 3), dtype=np.uint16)
+            local.out = np.empty((h, w, 3), dtype=np.uint8)
+            local.widened = {}
+        return local
+
+    def widen(frame, slot, widened):
+        # Stills return the same array every frame; keep its uint16 copy.
+        cached = widened.get(slot)
+        if cached is not None and cached[0] is frame:
+            return cached[1]
+        wide = np.asarray(frame)[:, :, :3].astype(np.uint16)
+        widened[slot] = (frame, wide)
+        return wide
+
+    def make_frame(t):
+        buf = buffers()
+        out = buf.out
+        wgt = weight(t)
+        if wgt <= 0:
+            np.copyto(out, c1.get_frame(t)[:, :, :3], casting='unsafe')
+            return out
+        if wgt >= 256:
+            np.copyto(out, c2.get_frame(t)[:, :, :3], casting='unsafe')
+            return out
+        a = widen(c1.get_frame(t), 0, buf.widened)
+        b = widen(c2.get_frame(t), 1, buf.widened)
+        np.multiply(a, 256 - wgt, out=buf.scratch)
+        np.multiply(b, wgt, out=buf.scratch_b)
+        np.add(buf.scratch, buf.scratch_b, out=buf.scratch)
+        np.right_shift(buf.scratch, 8, out=buf.scratch)
+        np.copyto(out, buf.scratch, casting='unsafe')
+        return out
+
+    return VideoClip(make_frame, duration=duration)
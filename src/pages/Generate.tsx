@@ -386,7 +386,40 @@ const Generate: React.FC = () => {
     if (e.target.files) addFiles(Array.from(e.target.files));
   };
 
+  // Let the server preprocess the photos while settings are being picked:
+  // one request in flight, each photo sent once, nothing while our job renders
+  const prewarmedRef = useRef<Set<string>>(new Set());
+  const prewarmPendingRef = useRef<File[]>([]);
+  const prewarmInFlightRef = useRef(false);
+  const fileKey = (file: File) => `${file.name}:${file.size}:${file.lastModified}`;
+
+  const flushPrewarm = () => {
+    if (prewarmInFlightRef.current) return;
+    const images = prewarmPendingRef.current.slice(0, MAX_IMAGES);
+    prewarmPendingRef.current = [];
+    if (images.length === 0) return;
+    const formData = new FormData();
+    images.forEach(file => formData.append('images', file));
+    prewarmInFlightRef.current = true;
+    fetch('/api/prewarm', { method: 'POST', body: formData })
+      .catch(() => undefined)
+      .finally(() => {
+        prewarmInFlightRef.current = false;
+        flushPrewarm();
+      });
+  };
+
+  const prewarmImages = (images: File[]) => {
+    if (status === 'queued' || status === 'running') return;
+    const fresh = images.filter(file => !prewarmedRef.current.has(fileKey(file)));
+    if (fresh.length === 0) return;
+    fresh.forEach(file => prewarmedRef.current.add(fileKey(file)));
+    prewarmPendingRef.current.push(...fresh);
+    flushPrewarm();
+  };
+
   const addFiles = (newFiles: File[]) => {
+    prewarmImages(newFiles.filter(f => f.type.startsWith('image/')));
     setFiles(prev => {
       const images = newFiles.filter(f => f.type.startsWith('image/'));
       const remaining = MAX_IMAGES - prev.length;